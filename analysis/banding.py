@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+
+# The bands of the age and IMD breakdowns, which were previously `categorised_as`
+# definitions in `demographics.get_demographics`. Each band includes its lower edge
+# and excludes its upper edge.
+AGE_BANDS = {
+    "edges": [0, 18, 30, 40, 50, 60, 70, 80, 120],
+    "labels": ["0-17", "18-29", "30-39", "40-49", "50-59", "60-69", "70-79", "80+"],
+    "missing": "missing",
+}
+CHILDREN_AGE_BANDS = {
+    "edges": [0, 6, 11, 18],
+    "labels": ["0-5", "6-10", "11-17"],
+    "missing": "missing",
+}
+IMD_QUINTILES = {
+    "edges": [32844 * i / 5 for i in range(6)],
+    "labels": ["Most deprived", "2", "3", "4", "Least deprived"],
+    "missing": "Missing",
+}
+
+# The raw variable each banded breakdown is calculated from
+RAW_VARIABLES = {"age": "age_years", "imd": "imd_rank"}
+
+# The populations of a study. The adults and children are selected from the cohorts
+# of all patients by `filter_population`, rather than each being extracted.
+POPULATIONS = ["all", "adults", "children"]
+
+
+def band(values, edges, labels, missing):
+    """
+    Assign values to bands.
+
+    Args:
+        values (array-like): The values to band, e.g. ages in years.
+        edges (list): The increasing edges of the bands. A value is in band `i` if
+            `edges[i] <= value < edges[i + 1]`.
+        labels (list): The label of each band. Should have one fewer items than `edges`.
+        missing (str): The label for values outside the bands, or null.
+
+    Returns:
+        pd.Categorical: The band of each value.
+    """
+    if len(labels) != len(edges) - 1:
+        raise ValueError("There should be one more edge than there are labels.")
+
+    codes = np.digitize(np.asarray(values, dtype=float), edges)
+    # codes are 0 below the first edge, and len(edges) at or above the last edge
+    # or for NaN; all of these are missing.
+    names = np.array([missing, *labels, missing], dtype=object)
+    return pd.Categorical(names[codes], categories=[*labels, missing])
+
+
+def age_bands(edges):
+    """
+    Age bands with the given edges, labelled by the ages they include, e.g. "18-29".
+    A last band ending at 120 or over is labelled as open, e.g. "80+".
+
+    Args:
+        edges (list): The increasing edges of the bands, in whole years.
+
+    Returns:
+        dict: The bands, as keyword arguments to `band`.
+    """
+    labels = [f"{lower}-{upper - 1}" for lower, upper in zip(edges, edges[1:])]
+    if edges[-1] >= AGE_BANDS["edges"][-1]:
+        labels[-1] = f"{edges[-2]}+"
+    return {"edges": list(edges), "labels": labels, "missing": AGE_BANDS["missing"]}
+
+
+def imd_bands(n):
+    """
+    IMD bands that split the ranks into `n` equal bands, from "Most deprived" to
+    "Least deprived". `imd_bands(5)` are the IMD quintiles.
+    """
+    max_rank = IMD_QUINTILES["edges"][-1]
+    labels = [str(i) for i in range(1, n + 1)]
+    labels[0] = IMD_QUINTILES["labels"][0]
+    labels[-1] = IMD_QUINTILES["labels"][-1]
+    return {
+        "edges": [max_rank * i / n for i in range(n + 1)],
+        "labels": labels,
+        "missing": IMD_QUINTILES["missing"],
+    }
+
+
+def default_age_bands(age_years):
+    """
+    The age bands of a cohort's population: `CHILDREN_AGE_BANDS` for a cohort
+    extracted for children, whose patients are all under 18, and `AGE_BANDS` for
+    any other.
+
+    Args:
+        age_years (pd.Series): The age of each patient in the cohort, in years.
+
+    Returns:
+        dict: The bands, as keyword arguments to `band`.
+    """
+    ages = age_years.dropna()
+    if len(ages) and (ages < CHILDREN_AGE_BANDS["edges"][-1]).all():
+        return CHILDREN_AGE_BANDS
+    return AGE_BANDS
+
+
+def add_bands(df, age=None, imd=None):
+    """
+    Add the "age" and "imd" breakdowns to a cohort from its raw "age_years" and
+    "imd_rank" columns.
+
+    Cohorts extracted before the raw IMD rank was kept already have the breakdown
+    columns. These are kept, unless bands are given to replace them.
+
+    Args:
+        df (pd.DataFrame): A cohort.
+        age (dict, optional): The age bands, from `age_bands`. Defaults to the
+            bands of the cohort's population, from `default_age_bands`.
+        imd (dict, optional): The IMD bands, from `imd_bands`. Defaults to `IMD_QUINTILES`.
+
+    Returns:
+        pd.DataFrame: The cohort with the breakdown columns.
+    """
+    if age is None and RAW_VARIABLES["age"] in df.columns:
+        age_default = default_age_bands(df[RAW_VARIABLES["age"]])
+    else:
+        age_default = AGE_BANDS
+    for column, bands, default in [
+        ("age", age, age_default),
+        ("imd", imd, IMD_QUINTILES),
+    ]:
+        raw_column = RAW_VARIABLES[column]
+        if raw_column in df.columns and (bands is not None or column not in df):
+            df[column] = band(df[raw_column], **(bands or default))
+    return df
+
+
+def band_ages(age_years, children=False):
+    """Assign ages in years to the age bands used for the age breakdown."""
+    bands = CHILDREN_AGE_BANDS if children else AGE_BANDS
+    return band(age_years, **bands)
+
+
+def band_imd(imd_rank):
+    """Assign IMD ranks to the quintiles used for the IMD breakdown."""
+    return band(imd_rank, **IMD_QUINTILES)
+
+
+def in_age_population(age_years, population="all"):
+    """
+    Whether each patient is old enough, or young enough, to be in a population, as
+    in the `population_filters` of the study definition.
+
+    Args:
+        age_years (pd.Series): The age of each patient in years.
+        population (str): One of `POPULATIONS`.
+
+    Returns:
+        pd.Series: A boolean mask of the patients in the population.
+    """
+    if population == "adults":
+        return (age_years >= 18) & (age_years <= 120)
+    if population == "children":
+        return age_years < 18
+    return pd.Series(True, index=age_years.index)
+
+
+def filter_population(df, population="all"):
+    """
+    Select the patients of a population from a cohort of all patients by their
+    "age_years", banding the ages of children with `CHILDREN_AGE_BANDS` as they're
+    selected. `add_bands` keeps these bands, unless it's given others.
+
+    Args:
+        df (pd.DataFrame): A cohort extracted for the "all" population.
+        population (str): One of `POPULATIONS`.
+
+    Returns:
+        pd.DataFrame: The patients of the population.
+    """
+    if population == "all":
+        return df
+    # take returns a copy, so columns can be added without chained assignment warnings
+    df = df.take(np.flatnonzero(in_age_population(df["age_years"], population)))
+    if population == "children":
+        df["age"] = band(df["age_years"], **CHILDREN_AGE_BANDS)
+    return df
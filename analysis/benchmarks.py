@@ -0,0 +1,276 @@
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from analysis.cohort_utils import cohort_format, read_cohorts
+from analysis.report_utils import BASE_DIR, match_input_files
+
+
+REPORT_OPTIONS = [
+    ("static", "inline", "png"),
+    ("static", "inline", "webp"),
+    ("static", "inline", "svg"),
+    ("static", "external", "png"),
+    ("static", "external", "webp"),
+    ("static", "external", "svg"),
+    ("interactive", "inline", "png"),
+]
+
+# (format, compression) of the cohort files, named as pyarrow names them
+INPUT_FORMATS = [
+    ("feather", "uncompressed"),
+    ("feather", "lz4"),
+    ("feather", "zstd"),
+    ("parquet", "none"),
+    ("parquet", "lz4"),
+    ("parquet", "zstd"),
+]
+
+
+def directory_size(path):
+    """Total size in bytes of all files under `path`"""
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def copy_report_inputs(output_dir, destination):
+    """
+    Copy the files needed to render a report, skipping the (large) cohort files
+    Args:
+        output_dir (Path): the study output directory
+        destination (Path): directory to copy to
+    """
+    shutil.copytree(
+        output_dir,
+        destination,
+        ignore=shutil.ignore_patterns("*.feather", "*.parquet", "*.arrow"),
+    )
+
+
+def benchmark_report(output_dir, render_args, repeats=3):
+    """
+    Time report generation and measure the size of its outputs for each report
+    mode, image mode and image format. Each report is rendered in a fresh process,
+    as it is in the pipeline, into a scratch copy of `output_dir`.
+    Args:
+        output_dir (Path): the study output directory, with charts already plotted
+        render_args (list): additional arguments passed through to render_report.py
+        repeats (int): number of times to render each report. The fastest is reported.
+    Returns:
+        list of dicts, one per combination of options
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for report_mode, image_mode, image_format in REPORT_OPTIONS:
+            scratch = Path(tmp) / f"{report_mode}_{image_mode}_{image_format}"
+            copy_report_inputs(output_dir, scratch)
+            timings = []
+            for _ in range(repeats):
+                shutil.rmtree(scratch / "assets", ignore_errors=True)
+                start = time.perf_counter()
+                subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "analysis.render_report",
+                        f"--output-dir={scratch}",
+                        f"--report-mode={report_mode}",
+                        f"--image-mode={image_mode}",
+                        f"--image-format={image_format}",
+                        *render_args,
+                    ],
+                    cwd=BASE_DIR,
+                    check=True,
+                )
+                timings.append(time.perf_counter() - start)
+
+            html_size = (scratch / "report.html").stat().st_size
+            assets_size = (
+                directory_size(scratch / "assets")
+                if (scratch / "assets").exists()
+                else 0
+            )
+            results.append(
+                {
+                    "report_mode": report_mode,
+                    "image_mode": image_mode,
+                    "image_format": image_format,
+                    "seconds": min(timings),
+                    "html_bytes": html_size,
+                    "assets_bytes": assets_size,
+                    "total_bytes": html_size + assets_size,
+                }
+            )
+    return results
+
+
+def cohort_files(input_dir):
+    """The monthly and weekly cohort files in a directory"""
+    return sorted(
+        f
+        for f in Path(input_dir).iterdir()
+        if match_input_files(f.name) or match_input_files(f.name, weekly=True)
+    )
+
+
+def convert_cohorts(input_dir, destination, file_format, compression):
+    """
+    Write a copy of each cohort file in `input_dir` in another format
+    Args:
+        input_dir (Path): directory containing the cohort files
+        destination (Path): directory to write the copies to
+        file_format (str): "feather" or "parquet"
+        compression (str): the codec, as in `INPUT_FORMATS`
+    """
+    destination.mkdir(parents=True)
+    for f in cohort_files(input_dir):
+        table = ds.dataset(f, format=cohort_format(f)).to_table()
+        path = destination / f"{f.stem}.{file_format}"
+        if file_format == "parquet":
+            pq.write_table(table, path, compression=compression)
+        else:
+            feather.write_feather(table, path, compression=compression)
+
+
+def read_inputs(input_dir, memory=False):
+    """
+    Read every cohort file in `input_dir` as the measures and event counts actions
+    do, in this process.
+    Args:
+        input_dir (Path): directory containing the cohort files
+        memory (bool): whether to measure the peak memory of the read, rather than
+            time it. Tracing the allocations slows the read, so they're measured
+            in separate reads.
+    Returns:
+        dict of the time taken, or of the peak memory allocated while reading, in
+        bytes. That's the peak of the allocations traced by tracemalloc, which
+        include the data frames' arrays, plus the peak of Arrow's memory pool.
+    """
+    if not memory:
+        start = time.perf_counter()
+        for _ in read_cohorts(cohort_files(input_dir)):
+            pass
+        return {"seconds": time.perf_counter() - start}
+
+    # the peaks are of this read, unlike the process's peak resident memory, which
+    # includes everything since it started, such as importing pandas
+    tracemalloc.start()
+    for _ in read_cohorts(cohort_files(input_dir)):
+        pass
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"peak_bytes": traced_peak + pa.default_memory_pool().max_memory()}
+
+
+def benchmark_inputs(input_dir, repeats=3):
+    """
+    Time reading the cohort files, and measure the memory it takes and the size of
+    the files, for each format and compression. The cohort files are converted into
+    scratch directories, and each read is run in a fresh process so that it isn't
+    affected by the ones before it.
+    Args:
+        input_dir (Path): directory containing the cohort files
+        repeats (int): number of times to time reading each copy. The fastest is
+            reported. The peak memory is measured in one more read.
+    Returns:
+        list of dicts, one per format and compression
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_format, compression in INPUT_FORMATS:
+            scratch = Path(tmp) / f"{file_format}_{compression}"
+            convert_cohorts(input_dir, scratch, file_format, compression)
+            reads = []
+            for memory in [False] * repeats + [True]:
+                completed = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "analysis.benchmarks",
+                        "read-inputs",
+                        f"--input-dir={scratch}",
+                        *(["--memory"] if memory else []),
+                    ],
+                    cwd=BASE_DIR,
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+                reads.append(json.loads(completed.stdout))
+
+            results.append(
+                {
+                    "format": file_format,
+                    "compression": compression,
+                    "seconds": min(r["seconds"] for r in reads[:-1]),
+                    "peak_bytes": reads[-1]["peak_bytes"],
+                    "disk_bytes": directory_size(scratch),
+                }
+            )
+            shutil.rmtree(scratch)
+    return results
+
+
+def print_table(results):
+    columns = list(results[0].keys())
+    print("\t".join(columns))
+    for row in results:
+        print(
+            "\t".join(
+                f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c])
+                for c in columns
+            )
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    report_parser = subparsers.add_parser(
+        "report",
+        help="Report generation time and size. Unrecognised arguments are passed to render_report.py",
+    )
+    report_parser.add_argument("--output-dir", type=Path, required=True)
+    report_parser.add_argument("--repeats", type=int, default=3)
+
+    inputs_parser = subparsers.add_parser(
+        "inputs",
+        help="Cohort read time, peak memory and size for each format and compression",
+    )
+    inputs_parser.add_argument("--input-dir", type=Path, required=True)
+    inputs_parser.add_argument("--repeats", type=int, default=3)
+
+    # one read of the inputs benchmark, run in its own process
+    read_parser = subparsers.add_parser("read-inputs")
+    read_parser.add_argument("--input-dir", type=Path, required=True)
+    read_parser.add_argument("--memory", action="store_true")
+
+    return parser.parse_known_args()
+
+
+def main():
+    args, extra_args = parse_args()
+
+    if args.benchmark == "report":
+        results = benchmark_report(args.output_dir, extra_args, repeats=args.repeats)
+    elif args.benchmark == "inputs":
+        results = benchmark_inputs(args.input_dir, repeats=args.repeats)
+    elif args.benchmark == "read-inputs":
+        print(json.dumps(read_inputs(args.input_dir, memory=args.memory)))
+        return
+
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from analysis.banding import POPULATIONS, band_ages, band_imd, in_age_population
+from analysis.cohort_utils import read_cohort
+from analysis.event_flags import OPERATORS, derive_event_flags, parse_operator
+from analysis.measures import (
+    FILTERS,
+    calculate_measures,
+    filter_data,
+    write_measures,
+)
+from analysis.report_utils import period_column, registration_column, time_to_days
+
+
+def period_starts(start_date, end_date, frequency):
+    """
+    The index dates of the periods between two dates, as cohortextractor's
+    `--index-date-range="<start_date> to <end_date> by <month|week>"` generates them.
+
+    Args:
+        start_date (str): The first index date.
+        end_date (str): The last date an index date can be on.
+        frequency (str): "monthly" or "weekly".
+
+    Returns:
+        pd.DatetimeIndex: The index date of each period.
+    """
+    freq = "7D" if frequency == "weekly" else "MS"
+    return pd.date_range(start_date, end_date, freq=freq)
+
+
+def codelist_1_windows(index_dates, frequency):
+    """
+    The windows codelist 1 events are counted in for each period. Mirrors
+    `calculate_variable_windows_codelist_1`; both ends are inclusive.
+
+    Args:
+        index_dates (pd.DatetimeIndex): The index date of each period.
+        frequency (str): "monthly" or "weekly".
+
+    Returns:
+        tuple: The start and end dates of each window.
+    """
+    if frequency == "weekly":
+        ends = index_dates + pd.Timedelta(days=7)
+    else:
+        ends = index_dates + pd.offsets.MonthEnd(0)
+    return index_dates, ends
+
+
+def codelist_2_windows(index_dates, codelist_1_window, comparison_date, days):
+    """
+    The windows codelist 2 events are counted in for each period. Mirrors
+    `calculate_variable_windows_codelist_2`; both ends are inclusive.
+
+    Args:
+        index_dates (pd.DatetimeIndex): The index date of each period.
+        codelist_1_window (tuple): The codelist 1 windows.
+        comparison_date (str): "start_date" or "end_date".
+        days (int): The number of days before the comparison date that events count.
+
+    Returns:
+        tuple: The start and end dates of each window.
+
+    Raises:
+        ValueError: If the comparison date isn't "start_date" or "end_date".
+    """
+    lookback = pd.Timedelta(days=days)
+    if comparison_date == "start_date":
+        return index_dates - lookback, index_dates
+    elif comparison_date == "end_date":
+        return codelist_1_window[0] - lookback, codelist_1_window[1]
+    else:
+        # windows relative to each patient's event 1 are found with `events_before`
+        raise ValueError(
+            "Unknown codelist 2 comparison date for period windows: "
+            f"{comparison_date}. Should be start_date or end_date"
+        )
+
+
+def event_periods(dates, window_starts, window_ends):
+    """
+    Find the periods whose window contains each event. Window starts and ends both
+    increase with the period, so the periods containing an event are consecutive.
+
+    Args:
+        dates (pd.Series): The date of each event.
+        window_starts (pd.DatetimeIndex): The start of each period's window.
+        window_ends (pd.DatetimeIndex): The end of each period's window.
+
+    Returns:
+        tuple: Arrays of the first and last period containing each event. The first
+            is greater than the last for events outside every window.
+    """
+    dates = dates.values.astype("datetime64[D]")
+    first = np.searchsorted(window_ends.values.astype("datetime64[D]"), dates, "left")
+    last = (
+        np.searchsorted(window_starts.values.astype("datetime64[D]"), dates, "right")
+        - 1
+    )
+    return first, last
+
+
+def ever_flags(earliest_dates, window_ends):
+    """
+    Whether each patient has had an event on or before the end of each period's
+    window, from the date of their earliest event, for every period at once.
+
+    Args:
+        earliest_dates (pd.Series): The date of each patient's earliest event, or null.
+        window_ends (pd.DatetimeIndex): The end of each period's window.
+
+    Returns:
+        np.ndarray: A (patient x period) boolean array.
+    """
+    earliest_dates = pd.to_datetime(earliest_dates).values.astype("datetime64[D]")
+    window_ends = window_ends.values.astype("datetime64[D]")
+    # NaT compares as False, so patients with no events are never flagged
+    return earliest_dates[:, np.newaxis] <= window_ends[np.newaxis, :]
+
+
+def long_events(cohort, event_name):
+    """
+    Reshape the `{event_name}_date_{i}` and `{event_name}_code_{i}` columns of a
+    cohort to one row per event.
+
+    The columns are of the latest event in each period's window. Windows that
+    overlap, such as codelist 2 windows that start before their period, can have the
+    same latest event, which is only kept once.
+
+    Args:
+        cohort (pd.DataFrame): A cohort extracted with `study_definition_long`.
+        event_name (str): "event_1" or "event_2".
+
+    Returns:
+        pd.DataFrame: The patient, date and code of each event, sorted by patient
+            and date.
+    """
+    pattern = re.compile(rf"^{event_name}_date_(\d+)$")
+    numbers = sorted(
+        int(match.group(1)) for match in map(pattern.match, cohort) if match
+    )
+    events = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "patient_id": cohort["patient_id"],
+                    "date": pd.to_datetime(cohort[f"{event_name}_date_{i}"]),
+                    "code": cohort[f"{event_name}_code_{i}"],
+                }
+            )
+            for i in numbers
+        ],
+        ignore_index=True,
+    )
+    events = events.loc[events["date"].notna(), :].drop_duplicates()
+    return events.sort_values(["patient_id", "date"], kind="stable")
+
+
+def latest_events(events, first, last, period):
+    """
+    The latest event of each patient in a period's window, as cohortextractor
+    returns when an event query matches more than one event.
+
+    Args:
+        events (pd.DataFrame): Events from `long_events`.
+        first (np.ndarray): The first period containing each event.
+        last (np.ndarray): The last period containing each event.
+        period (int): The period.
+
+    Returns:
+        pd.DataFrame: The date and code of the latest event, indexed by patient.
+    """
+    in_window = (first <= period) & (last >= period)
+    return (
+        events.loc[in_window, :]
+        .drop_duplicates("patient_id", keep="last")
+        .set_index("patient_id")
+    )
+
+
+def events_before(anchors, events, days=None):
+    """
+    The latest event of each patient on or before, and no more than `days` days
+    before, the date of their anchor event, e.g. the codelist 2 event in the window
+    before a patient's codelist 1 event when codelist 2 is compared to event 1.
+    Mirrors a `between=["event_1_date - <days> days", "event_1_date"]` query.
+
+    The anchors and events are joined with `pd.merge_asof` on the date, by patient,
+    so every patient's window is found in one sorted pass rather than by date
+    arithmetic per patient, and a different number of days is a new join rather
+    than a new extraction.
+
+    Args:
+        anchors (pd.Series): The date of each patient's anchor event, indexed by
+            patient, or null.
+        events (pd.DataFrame): Events from `long_events`.
+        days (int, optional): The number of days before the anchor that events
+            count. Events any time before it count if None.
+
+    Returns:
+        pd.DataFrame: The date and code of the latest event, indexed by patient, for
+            the patients with one.
+    """
+    anchors = anchors.dropna().rename("anchor_date").rename_axis("patient_id")
+    joined = pd.merge_asof(
+        anchors.reset_index().sort_values("anchor_date", kind="stable"),
+        events.sort_values("date", kind="stable"),
+        left_on="anchor_date",
+        right_on="date",
+        by="patient_id",
+        direction="backward",
+        tolerance=None if days is None else pd.Timedelta(days=days),
+    )
+    return joined.loc[joined["date"].notna(), ["patient_id", "date", "code"]].set_index(
+        "patient_id"
+    )
+
+
+def age_in_years(date_of_birth, index_date):
+    """
+    Age on the index date, from a date of birth recorded to the month.
+
+    Args:
+        date_of_birth (pd.Series): Dates of birth, recorded to the month, as dates.
+        index_date (pd.Timestamp): The date to calculate ages on.
+
+    Returns:
+        pd.Series: The age of each patient, in whole years.
+    """
+    months = (index_date.year - date_of_birth.dt.year) * 12 + (
+        index_date.month - date_of_birth.dt.month
+    )
+    return months // 12
+
+
+def in_population(cohort, index_date, age_years, population="all"):
+    """
+    Whether each patient is in the population on an index date, i.e. registered
+    and alive (and an adult or child, for those populations).
+
+    Registration is from the `registration_column` flag of the index date, so
+    patients who register after it, as well as those who deregister before it,
+    aren't in its population.
+
+    Args:
+        cohort (pd.DataFrame): A cohort extracted with `study_definition_long`, with
+            "died_date" parsed as dates.
+        index_date (pd.Timestamp): The index date of the period.
+        age_years (pd.Series): The age of each patient on the index date.
+        population (str): "all", "adults" or "children".
+
+    Returns:
+        pd.Series: A boolean mask of the patients in the population.
+
+    Raises:
+        ValueError: If the cohort has no registration flag for the index date.
+    """
+    column = registration_column(index_date)
+    if column not in cohort:
+        raise ValueError(
+            f"The cohort has no {column} column. Was it extracted with the same "
+            "start date and frequency?"
+        )
+    alive = cohort["died_date"].isna() | (cohort["died_date"] > index_date)
+    registered = cohort[column] == 1
+    return alive & registered & in_age_population(age_years, population)
+
+
+def iter_period_frames(
+    cohort,
+    index_dates,
+    frequency="monthly",
+    comparison_date="end_date",
+    days=0,
+    population="all",
+    ever=False,
+    operator="AND",
+):
+    """
+    Bin a long cohort into one cohort per period, with the same columns as the
+    cohorts `study_definition` extracts for each index date.
+
+    With `ever`, a patient has codelist 2 in a period if their earliest codelist 2
+    event (the cohort's "event_2_ever_date") is on or before the end of the period's
+    window. The code and date are of their latest event on or before the end of
+    the window, or of their earliest event if they have none in the study range.
+
+    Region, IMD and practice are from their `period_column` of each index date, as
+    `study_definition` extracts them as of each index date. Cohorts extracted with
+    them as of the end date only, as single columns, have them in every period.
+
+    Args:
+        cohort (pd.DataFrame): A cohort extracted with `study_definition_long`.
+        index_dates (pd.DatetimeIndex): The index date of each period.
+        frequency (str): "monthly" or "weekly".
+        comparison_date (str): The codelist 2 comparison date: "start_date",
+            "end_date", or "event_1_date" for the days before each patient's codelist
+            1 event in the period.
+        days (int): The number of days before the comparison date that codelist 2
+            events count.
+        population (str): "all", "adults" or "children".
+        ever (bool): Whether codelist 2 events count any time before the end of
+            the window, as with `time_ever`.
+        operator (str): One of `OPERATORS`, to combine the events into
+            "event_measure".
+
+    Yields:
+        tuple: The index date of each period, as YYYY-MM-DD, and its cohort.
+    """
+    codelist_1_window = codelist_1_windows(index_dates, frequency)
+    windows = {"event_1": codelist_1_window}
+    # codelist 2 compared to event 1 has a window for each patient, not each period
+    anchored = comparison_date not in ("start_date", "end_date")
+    if anchored:
+        event_2 = long_events(cohort, "event_2")
+    else:
+        windows["event_2"] = codelist_2_windows(
+            index_dates, codelist_1_window, comparison_date, days
+        )
+    if ever and not anchored:
+        window_ends = windows["event_2"][1]
+        # the earliest day whose nanoseconds can be cast to days without overflowing
+        window_starts = pd.DatetimeIndex(
+            [pd.Timestamp.min.ceil("D") + pd.Timedelta(days=1)] * len(window_ends)
+        )
+        windows["event_2"] = (window_starts, window_ends)
+        event_2_ever = ever_flags(cohort["event_2_ever_date"], window_ends)
+
+    events = {event_name: long_events(cohort, event_name) for event_name in windows}
+    periods = {
+        event_name: event_periods(events[event_name]["date"], *windows[event_name])
+        for event_name in windows
+    }
+    static_columns = [c for c in ["patient_id", "sex"] if c in cohort]
+    cohort = cohort.assign(
+        date_of_birth=pd.to_datetime(cohort["date_of_birth"], format="%Y-%m"),
+        died_date=pd.to_datetime(cohort["died_date"]),
+    )
+
+    for period, index_date in enumerate(index_dates):
+        age_years = age_in_years(cohort["date_of_birth"], index_date)
+        mask = in_population(cohort, index_date, age_years, population)
+
+        df = cohort.loc[mask, static_columns].assign(age_years=age_years[mask])
+        for variable in ["region", "practice", "imd_rank"]:
+            column = period_column(variable, index_date)
+            if column in cohort:
+                df[variable] = cohort.loc[mask, column]
+            elif variable in cohort:
+                df[variable] = cohort.loc[mask, variable]
+        df["age"] = band_ages(df["age_years"], children=population == "children")
+        if "imd_rank" in df:
+            df["imd"] = band_imd(df.pop("imd_rank"))
+
+        df = df.set_index("patient_id")
+        for event_name in windows:
+            latest = latest_events(events[event_name], *periods[event_name], period)
+            df[event_name] = df.index.isin(latest.index).astype(int)
+            df[f"{event_name}_code"] = latest["code"].reindex(df.index)
+            df[f"{event_name}_date"] = (
+                latest["date"].reindex(df.index).dt.strftime("%Y-%m-%d")
+            )
+
+        if anchored:
+            anchors = pd.to_datetime(df["event_1_date"])
+            latest = events_before(anchors, event_2, None if ever else days)
+            if ever:
+                # patients whose only events before event 1 are before the study
+                # range have their earliest event from the ever columns
+                ever_events = pd.DataFrame(
+                    {
+                        "date": pd.to_datetime(cohort.loc[mask, "event_2_ever_date"]),
+                        "code": cohort.loc[mask, "event_2_ever_code"],
+                    }
+                ).set_axis(df.index)
+                earliest = ~df.index.isin(latest.index) & (
+                    ever_events["date"] <= anchors
+                )
+                latest = pd.concat([latest, ever_events.loc[earliest, :]])
+            df["event_2"] = df.index.isin(latest.index).astype(int)
+            df["event_2_code"] = latest["code"].reindex(df.index)
+            df["event_2_date"] = (
+                latest["date"].reindex(df.index).dt.strftime("%Y-%m-%d")
+            )
+
+        if ever and not anchored:
+            flagged = event_2_ever[mask.values, period]
+            earliest = df["event_2_date"].isna() & flagged
+            df["event_2"] = flagged.astype(int)
+            df.loc[earliest, "event_2_code"] = cohort.loc[mask, "event_2_ever_code"][
+                earliest.values
+            ].values
+            df.loc[earliest, "event_2_date"] = cohort.loc[mask, "event_2_ever_date"][
+                earliest.values
+            ].values
+
+        df = derive_event_flags(df, operator)
+
+        yield f"{index_date:%Y-%m-%d}", df.reset_index()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Bin a cohort extracted with study_definition_long into periods"
+    )
+    parser.add_argument("--input-file", type=Path, required=True)
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--start-date", type=str, required=True)
+    parser.add_argument("--end-date", type=str, required=True)
+    parser.add_argument("--frequency", choices=["monthly", "weekly"], default="monthly")
+    parser.add_argument(
+        "--codelist-2-comparison-date",
+        choices=["start_date", "end_date", "event_1_date"],
+        default="end_date",
+    )
+    parser.add_argument("--time-value", type=str, default="None")
+    parser.add_argument("--time-scale", type=str, default="")
+    parser.add_argument("--population", choices=POPULATIONS, default="all")
+    parser.add_argument(
+        "--operator",
+        type=parse_operator,
+        choices=list(OPERATORS),
+        default="AND",
+        help="How the events are combined into the measure",
+    )
+    parser.add_argument(
+        "--time-ever",
+        action="store_true",
+        help="Count codelist 2 events any time before the end of each window",
+    )
+    parser.add_argument(
+        "--measures",
+        action="store_true",
+        help="Write the measure files rather than a cohort file per period",
+    )
+    parser.add_argument("--breakdowns", action="append", default=[])
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    time_value = (
+        None
+        if args.time_value.lower().strip() in ("none", "")
+        else int(args.time_value)
+    )
+    time_scale = None if args.time_scale.lower() in ("none", "") else args.time_scale
+
+    cohort = read_cohort(args.input_file)
+    frames = iter_period_frames(
+        cohort,
+        period_starts(args.start_date, args.end_date, args.frequency),
+        frequency=args.frequency,
+        comparison_date=args.codelist_2_comparison_date,
+        days=time_to_days(time_value, time_scale),
+        population=args.population,
+        ever=args.time_ever,
+        operator=args.operator,
+    )
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    if args.measures:
+        breakdowns = [*args.breakdowns, "practice", "event_1_code", "event_2_code"]
+        measure_df = calculate_measures(
+            (
+                (date, df.pipe(filter_data, FILTERS).assign(date=date))
+                for date, df in frames
+            ),
+            breakdowns,
+        )
+        write_measures(measure_df, args.output_dir)
+    else:
+        prefix = "input_weekly" if args.frequency == "weekly" else "input"
+        for date, df in frames:
+            df.to_feather(args.output_dir / f"{prefix}_{date}.feather")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import pyarrow.types as pat
+
+
+# The formats cohort files can be in, by extension, as named by `pyarrow.dataset`.
+# Arrow IPC files can be uncompressed or LZ4 or ZSTD compressed, and Parquet files
+# can use any of the codecs Arrow supports; the codec is read from the file.
+COHORT_FORMATS = {".feather": "ipc", ".arrow": "ipc", ".parquet": "parquet"}
+
+
+# Checks of the Arrow type of each kind of cohort column
+COLUMN_KINDS = {
+    "id": pat.is_integer,
+    "flag": lambda t: pat.is_integer(t) or pat.is_boolean(t),
+    "number": lambda t: pat.is_integer(t) or pat.is_floating(t),
+    # a date column with no dates is written with the null type
+    "date": lambda t: (
+        pat.is_string(t)
+        or pat.is_large_string(t)
+        or pat.is_temporal(t)
+        or pat.is_null(t)
+    ),
+    "any": lambda t: True,
+}
+
+
+def patient_lookup(df, column):
+    """
+    Build a lookup from patient ID to the value of a column, for joining a
+    patient-level cohort (such as the ethnicity cohort) onto other cohorts.
+
+    Args:
+        df (pd.DataFrame): A cohort with one row per patient. Should contain a
+            "patient_id" column.
+        column (str): The column to look up.
+
+    Returns:
+        tuple: The sorted patient IDs, and the value of the column for each.
+    """
+    patient_ids = df["patient_id"].to_numpy()
+    order = np.argsort(patient_ids, kind="stable")
+    return patient_ids[order], df[column].to_numpy()[order]
+
+
+def lookup_patients(patient_ids, lookup):
+    """
+    Look up the value for each patient, as a left join on patient ID would.
+
+    Args:
+        patient_ids (array-like): The patient IDs to look up.
+        lookup (tuple): The lookup from `patient_lookup`.
+
+    Returns:
+        np.ndarray: The value for each patient, or NaN for patients not in the lookup.
+    """
+    sorted_ids, values = lookup
+    patient_ids = np.asarray(patient_ids)
+    if len(sorted_ids) == 0:
+        return np.full(len(patient_ids), np.nan, dtype=object)
+
+    positions = np.searchsorted(sorted_ids, patient_ids)
+    # patients after the last ID in the lookup get an out of range position
+    positions = np.minimum(positions, len(sorted_ids) - 1)
+    found = sorted_ids[positions] == patient_ids
+
+    result = values[positions].astype(object)
+    result[~found] = np.nan
+    return result
+
+
+# the columns of the ethnicity cohort, for `check_cohort_schema`
+ETHNICITY_REQUIREMENTS = [[("patient_id", "id")], [("ethnicity", "any")]]
+
+
+def cohort_format(path):
+    """The format of a cohort file, from its extension. See `COHORT_FORMATS`."""
+    suffix = Path(path).suffix
+    if suffix not in COHORT_FORMATS:
+        raise ValueError(f"{Path(path).name}: not a cohort file format we can read")
+    return COHORT_FORMATS[suffix]
+
+
+def read_cohort(path, columns=None):
+    """
+    Read a cohort file in any of `COHORT_FORMATS`. Compressed files are decompressed
+    as they're read, with the columns (or Parquet column chunks) decoded in parallel
+    on Arrow's thread pool.
+
+    Args:
+        path (Path): The cohort file.
+        columns (list, optional): The columns to read. Defaults to all of them.
+
+    Returns:
+        pd.DataFrame: The cohort.
+    """
+    if cohort_format(path) == "parquet":
+        table = pq.read_table(path, columns=columns, use_threads=True)
+    else:
+        table = feather.read_table(path, columns=columns, use_threads=True)
+    return table.to_pandas(use_threads=True)
+
+
+def read_ethnicity_lookup(ethnicity_file):
+    """Build the patient ID to ethnicity lookup from the ethnicity cohort."""
+    return patient_lookup(
+        read_cohort(ethnicity_file, columns=["patient_id", "ethnicity"]),
+        "ethnicity",
+    )
+
+
+def read_cohorts(paths, read=read_cohort):
+    """
+    Read cohort files one after another, reading the next file on a background
+    thread while the current one is used. Arrow releases the GIL while it reads and
+    decodes a file, so the read overlaps with the work on the current cohort.
+
+    Only the next file is read ahead, so there are no more than two cohorts in
+    memory: the one being used and the next.
+
+    Args:
+        paths (list): The cohort files, in the order to read them.
+        read (callable): Reads a cohort file. Defaults to `read_cohort`.
+
+    Yields:
+        tuple: The path of each file and its cohort.
+    """
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_cohort = executor.submit(read, paths[0]) if paths else None
+        for i, path in enumerate(paths):
+            cohort = next_cohort.result()
+            if i + 1 < len(paths):
+                next_cohort = executor.submit(read, paths[i + 1])
+            yield path, cohort
+
+
+def check_cohort_schema(path, requirements):
+    """
+    Check that a cohort file has the columns that are needed, of the right types.
+    Only the schema and footer of the file are read, so files can be checked before
+    any are loaded. A cohort with no rows isn't a problem, as no patients may be in
+    the population in a period, but is warned about.
+
+    Args:
+        path (Path): The cohort file, in any of `COHORT_FORMATS`.
+        requirements (list): For each column that's needed, the (column, kind)
+            alternatives that satisfy it, in the order they're used. The kind is one
+            of `COLUMN_KINDS`.
+
+    Returns:
+        list: A description of each problem with the file.
+    """
+    dataset = ds.dataset(path, format=cohort_format(path))
+    schema = dataset.schema
+
+    problems = []
+    for alternatives in requirements:
+        present = [
+            (column, kind) for column, kind in alternatives if column in schema.names
+        ]
+        if not present:
+            columns = " or ".join(column for column, _ in alternatives)
+            problems.append(f"{path.name}: no {columns} column")
+            continue
+
+        # only the first of the alternatives is used, so only it needs the right type
+        column, kind = present[0]
+        column_type = schema.field(column).type
+        if not COLUMN_KINDS[kind](column_type):
+            problems.append(
+                f"{path.name}: {column} column is {column_type}, not a {kind} column"
+            )
+
+    if dataset.count_rows() == 0:
+        warnings.warn(f"{path.name}: no rows")
+    return problems
+
+
+def check_cohort_schemas(paths, requirements):
+    """Check each of a list of cohort files with `check_cohort_schema`."""
+    return [
+        problem for path in paths for problem in check_cohort_schema(path, requirements)
+    ]
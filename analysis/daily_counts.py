@@ -0,0 +1,273 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from analysis.banding import POPULATIONS, filter_population
+from analysis.binning import codelist_1_windows
+from analysis.cohort_utils import read_cohorts
+from analysis.event_flags import OPERATORS, derive_event_flags, parse_operator
+from analysis.report_utils import get_date_input_file, match_input_files
+
+
+class DailyCounts:
+    """
+    The number of events on each day, from the dates `measure_dates` finds in the
+    cohorts. Events in any window of days are counted from the cumulative counts, so
+    rolling weekly or monthly counts cost one subtraction each.
+
+    The cohorts only have the latest event of each patient in their codelist 1
+    window, so a patient with the measure counts once in each cohort, on the day of
+    their latest event. The counts of a monthly cohort's window are its number of
+    patients with the measure, less any whose event is outside the window.
+
+    The counts are updated from one cohort at a time, and record which cohorts they
+    include so that a cohort is never counted twice, and which days the cohorts'
+    windows cover. A day is only counted from the first cohort whose window covers
+    it, so cohorts with overlapping windows, such as a weekly cohort in the month of
+    a monthly one, don't count an event twice. They also record the operator of the
+    measure and the population, as counts of a different measure or population
+    can't be added to.
+    """
+
+    def __init__(
+        self,
+        start=None,
+        counts=None,
+        covered=None,
+        end=None,
+        sources=(),
+        operator="AND",
+        population="all",
+    ):
+        self.start = None if start is None else np.datetime64(start, "D")
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+        # whether each day is in the window of a cohort that's been counted
+        self.covered = np.zeros(len(self.counts), bool) if covered is None else covered
+        # the last day the counts are complete for, which can be after the last event
+        self.end = None if end is None else np.datetime64(end, "D")
+        self.sources = set(sources)
+        self.operator = operator
+        self.population = population
+        self._cumulative = None
+
+    @classmethod
+    def load(cls, path, operator="AND", population="all"):
+        """
+        Load counts saved with `save`, or empty counts if there aren't any, they were
+        counted with a different operator or population, or they were saved before
+        the days the cohorts cover were recorded, when they counted every day with a
+        codelist 1 event.
+        """
+        path = Path(path)
+        if not path.exists():
+            return cls(operator=operator, population=population)
+        with np.load(path) as saved:
+            if "covered" not in saved or (
+                saved["operator"].item(),
+                saved["population"].item(),
+            ) != (operator, population):
+                return cls(operator=operator, population=population)
+            return cls(
+                start=saved["start"].item() or None,
+                counts=saved["counts"],
+                covered=saved["covered"],
+                end=saved["end"].item() or None,
+                sources=saved["sources"].tolist(),
+                operator=operator,
+                population=population,
+            )
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                start="" if self.start is None else str(self.start),
+                counts=self.counts,
+                covered=self.covered,
+                end="" if self.end is None else str(self.end),
+                sources=np.array(sorted(self.sources), dtype=str),
+                operator=self.operator,
+                population=self.population,
+            )
+
+    def _extend(self, first, last):
+        """Extend the counts, with zeros, to include the days from first to last."""
+        if self.start is None:
+            self.start = first
+        before = max((self.start - first).astype(int), 0)
+        after = max((last - self.start).astype(int) + 1 + before - len(self.counts), 0)
+        self.counts = np.pad(self.counts, (before, after))
+        self.covered = np.pad(self.covered, (before, after))
+        self.start = min(self.start, first)
+
+    def update(self, dates, first, through, source):
+        """
+        Add the events of a cohort. Only the dates in the cohort's window are
+        counted, and only those on days that no cohort counted before covers.
+
+        Args:
+            dates (array-like): The date of each event.
+            first (str): The first day of the cohort's window.
+            through (str): The last day of the cohort's window.
+            source (str): A name for the cohort, e.g. its file name.
+
+        Returns:
+            bool: Whether the events were added, i.e. the cohort hadn't been already.
+        """
+        if source in self.sources:
+            return False
+
+        dates = pd.to_datetime(pd.Series(dates)).dropna().values.astype("datetime64[D]")
+        first, through = np.datetime64(first, "D"), np.datetime64(through, "D")
+        self._extend(first, through)
+
+        days = (dates[(dates >= first) & (dates <= through)] - self.start).astype(int)
+        days = days[~self.covered[days]]
+        self.counts += np.bincount(days, minlength=len(self.counts))
+        window = (first - self.start).astype(int), (through - self.start).astype(int)
+        self.covered[window[0] : window[1] + 1] = True
+
+        self.end = through if self.end is None else max(self.end, through)
+        self.sources.add(source)
+        self._cumulative = None
+        return True
+
+    @property
+    def cumulative(self):
+        """The number of events before each day, and after the last day."""
+        if self._cumulative is None:
+            self._cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        return self._cumulative
+
+    def total(self, first, last):
+        """
+        The number of events between two days, inclusive.
+
+        Args:
+            first (str): The first day.
+            last (str): The last day.
+
+        Returns:
+            int: The number of events.
+        """
+        if self.start is None:
+            return 0
+        positions = np.clip(
+            [
+                (np.datetime64(first, "D") - self.start).astype(int),
+                (np.datetime64(last, "D") - self.start).astype(int) + 1,
+            ],
+            0,
+            len(self.counts),
+        )
+        return int(self.cumulative[positions[1]] - self.cumulative[positions[0]])
+
+    def rolling(self, days):
+        """
+        The number of events in the window of `days` days ending on each day.
+
+        Returns:
+            pd.Series: The rolling counts, indexed by the last day of each window.
+        """
+        cumulative = self.cumulative
+        starts = np.maximum(np.arange(1, len(cumulative)) - days, 0)
+        return pd.Series(
+            cumulative[1:] - cumulative[starts],
+            index=pd.date_range(self.start, periods=len(self.counts)),
+        )
+
+    def periods(self, index_dates, frequency):
+        """
+        The number of events in each period, using the same windows as codelist 1.
+
+        Args:
+            index_dates (pd.DatetimeIndex): The index date of each period.
+            frequency (str): "monthly" or "weekly".
+
+        Returns:
+            pd.Series: The counts, indexed by the index date of each period.
+        """
+        starts, ends = codelist_1_windows(index_dates, frequency)
+        return pd.Series(
+            [self.total(start, end) for start, end in zip(starts, ends)],
+            index=index_dates,
+        )
+
+
+def measure_dates(df):
+    """
+    The date of the event of each patient with the measure in a cohort: their
+    codelist 1 event, or their codelist 2 event if they have no codelist 1 event, as
+    with the OR operator. A codelist 2 event can be before the cohort's window, such
+    as with `time_ever`, in which case `DailyCounts.update` doesn't count it.
+
+    Args:
+        df (pd.DataFrame): The cohort. Should contain "event_1", "event_1_date",
+            "event_2_date" and "event_measure".
+
+    Returns:
+        pd.Series: The dates, as strings, with nulls for patients without the measure.
+    """
+    return (
+        df["event_1_date"]
+        .where(df["event_1"] == 1, df["event_2_date"])
+        .where(df["event_measure"] == 1)
+    )
+
+
+def update_from_cohort(daily_counts, df, file_name, weekly=False):
+    """
+    Add the events with the measure in a cohort file to the daily counts.
+
+    Args:
+        daily_counts (DailyCounts): The daily counts.
+        df (pd.DataFrame): The cohort. See `measure_dates` for its columns.
+        file_name (str): The name of the cohort file.
+        weekly (bool): Whether the cohort is weekly.
+
+    Returns:
+        bool: Whether the cohort was added.
+    """
+    index_date = pd.DatetimeIndex([get_date_input_file(file_name, weekly=weekly)])
+    starts, ends = codelist_1_windows(index_date, "weekly" if weekly else "monthly")
+    return daily_counts.update(measure_dates(df), starts[0], ends[0], file_name)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Add new cohorts to the daily event counts"
+    )
+    parser.add_argument("--input-dir", type=Path, required=True)
+    parser.add_argument("--daily-counts", type=Path, required=True)
+    parser.add_argument(
+        "--operator",
+        type=parse_operator,
+        choices=list(OPERATORS),
+        default="AND",
+        help="How the events are combined into the measure",
+    )
+    parser.add_argument("--population", choices=POPULATIONS, default="all")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    daily_counts = DailyCounts.load(args.daily_counts, args.operator, args.population)
+
+    files = [
+        file
+        for file in sorted(args.input_dir.iterdir())
+        if match_input_files(file.name) and file.name not in daily_counts.sources
+    ]
+    added = 0
+    for file, df in read_cohorts(files):
+        df = derive_event_flags(filter_population(df, args.population), args.operator)
+        added += update_from_cohort(daily_counts, df, file.name)
+
+    daily_counts.save(args.daily_counts)
+    print(f"Added {added} cohorts, counting events to {daily_counts.end}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from analysis.measure_store import replace_file
+
+
+def population_key(**definition):
+    """
+    A key for a population, hashed from everything that its denominators depend
+    on: the population the cohorts are extracted for, and how they're filtered and
+    banded. The codelists aren't part of it, so studies of the same population
+    share their denominators.
+
+    Args:
+        **definition: JSON-serialisable values, e.g. `population="all"`.
+
+    Returns:
+        str: The key.
+    """
+    encoded = json.dumps(definition, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def file_digest(path):
+    """A digest of the contents of a file, such as the ethnicity cohort."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def cohort_digest(df):
+    """
+    A digest of the patients in a cohort, whatever order they're in. It's the
+    number of patients and the sum of the hashes of their IDs.
+    """
+    hashes = pd.util.hash_pandas_object(df["patient_id"], index=False).to_numpy()
+    # the sum wraps around, as the hashes are unsigned 64-bit ints
+    return f"{len(hashes)}-{np.add.reduce(hashes, dtype=np.uint64)}"
+
+
+def to_json_value(value):
+    """A group value as JSON, as numpy scalars aren't serialisable."""
+    return value.item() if hasattr(value, "item") else value
+
+
+class DenominatorCache:
+    """
+    A cache of the population counts of each value of a breakdown in each period,
+    shared by the studies of a population. Each entry is a small JSON file in a
+    directory for the population, named by the breakdown and the period.
+
+    An entry is only used if the cohort it's looked up for has the same patients as
+    the cohort it was counted from, by `cohort_digest`, and it's not older than
+    `max_age`, so a cohort extracted from a newer copy of the database isn't given
+    the denominators of an older one. Entries older than `max_age` are deleted by
+    `evict`, which then deletes the oldest entries until the cache is no larger than
+    `max_bytes`.
+    """
+
+    def __init__(self, path, population, max_age=30 * 24 * 60 * 60, max_bytes=10**8):
+        """
+        Args:
+            path (str): The cache directory, shared by all studies.
+            population (str): The key of the population, from `population_key`.
+            max_age (float): The age in seconds after which entries aren't used.
+            max_bytes (int): The largest the cache can be after `evict`.
+        """
+        self.path = Path(path)
+        self.population = population
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def entry_path(self, breakdown, period):
+        return self.path / self.population / f"{breakdown}_{period}.json"
+
+    def get(self, breakdown, period, patients):
+        """
+        Look up the counts of a breakdown's values in a period.
+
+        Args:
+            breakdown (str): The breakdown, e.g. "region".
+            period (str): The date of the cohort, e.g. "2021-01-01".
+            patients (str): The `cohort_digest` of the cohort.
+
+        Returns:
+            dict: The count of each value, or None if there isn't an entry that can
+                be used.
+        """
+        path = self.entry_path(breakdown, period)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                return None
+            with open(path) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # another study may have evicted it, or be writing it
+            return None
+        if entry.get("patients") != patients:
+            return None
+        return dict(zip(entry["values"], entry["counts"]))
+
+    def put(self, breakdown, period, patients, counts):
+        """
+        Add the counts of a breakdown's values in a period. See `get` for the
+        arguments.
+
+        Args:
+            counts (pd.Series): The count of each value, indexed by the values.
+        """
+        entry = {
+            "patients": patients,
+            "values": [to_json_value(value) for value in counts.index],
+            "counts": [int(count) for count in counts],
+        }
+        path = self.entry_path(breakdown, period)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        replace_file(path, lambda f: f.write(json.dumps(entry).encode()))
+
+    def evict(self):
+        """
+        Delete the entries of every population that are older than `max_age`, then
+        the oldest entries until the cache is no larger than `max_bytes`.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        entries = []
+        for path in self.path.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        now = time.time()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        deleted = 0
+        for mtime, entry_size, path in sorted(entries):
+            if now - mtime <= self.max_age and size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        return deleted
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def round_to_base(values, base):
+    """
+    Round values to the nearest multiple of a base, rounding halves to the even
+    multiple as the `round` builtin does, e.g. 25 rounds to 20 and 35 to 40 with a
+    base of 10.
+
+    Whole numbers are rounded with integer arithmetic, so large counts aren't subject
+    to the precision errors of dividing and multiplying floats. Other values are
+    rounded as `base * round(x / base)`, and NaNs are kept.
+
+    Args:
+        values (array-like): The values to round.
+        base (int): The base to round to.
+
+    Returns:
+        np.ndarray: The rounded values, as floats.
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = np.array(np.rint(values / base) * base)
+
+    whole = np.isfinite(values) & (values == np.floor(values))
+    quotient, remainder = np.divmod(values[whole].astype(np.int64), base)
+    # round up past the half way point, or at it when that makes the multiple even
+    up = (2 * remainder > base) | ((2 * remainder == base) & (quotient % 2 == 1))
+    rounded[whole] = (quotient + up) * base
+    return rounded
+
+
+def round_count(count, base):
+    """Round a single count to the nearest multiple of a base, as an int."""
+    return int(round_to_base(count, base))
+
+
+def redact_low_values(values, threshold, fill=0):
+    """
+    Redact values less-than or equal-to a threshold.
+
+    Args:
+        values (array-like): The values to redact.
+        threshold (int): The largest value to redact.
+        fill: The value to replace redacted values with. NaNs are also replaced.
+
+    Returns:
+        np.ndarray: The redacted values, as floats.
+    """
+    values = np.asarray(values, dtype=float)
+    return np.where(values > threshold, values, fill)
+
+
+def suppress_low_values(values, threshold):
+    """
+    Find the values to suppress so that neither they, nor their total, can be
+    disclosed. Values less-than or equal-to the threshold are suppressed. If their
+    total is more than zero, but still not more than the threshold, the smallest
+    remaining values are also suppressed until it is.
+
+    Args:
+        values (array-like): The values, e.g. the counts of each code.
+        threshold (int): The largest value to suppress.
+
+    Returns:
+        tuple: Whether each value is suppressed, and the total of the suppressed
+            values. The total is more than the threshold if it can be shown.
+    """
+    values = np.asarray(values, dtype=float)
+    suppressed = values <= threshold
+    total = values[suppressed].sum()
+
+    if 0 < total <= threshold:
+        remaining = np.flatnonzero(~suppressed)
+        # the smallest values first, ties in their original order
+        remaining = remaining[np.argsort(values[remaining], kind="stable")]
+        totals = total + np.cumsum(values[remaining])
+        # suppress up to and including the first value that takes the total over
+        # the threshold, or all of them if none do
+        over = np.flatnonzero(totals > threshold)
+        last = over[0] if len(over) else len(remaining) - 1
+        suppressed[remaining[: last + 1]] = True
+        if len(remaining):
+            total = totals[last]
+
+    return suppressed, total
@@ -0,0 +1,408 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from analysis import expectations
+from analysis.banding import AGE_BANDS, CHILDREN_AGE_BANDS, RAW_VARIABLES
+from analysis.binning import (
+    age_in_years,
+    codelist_1_windows,
+    codelist_2_windows,
+    in_population,
+    period_starts,
+)
+from analysis.report_utils import (
+    generate_expectations_codes,
+    registration_column,
+    time_to_days,
+)
+
+
+# `population_filters` expects 90% of patients to be registered and 10% to have died
+DEREGISTERED_INCIDENCE = 0.1
+DIED_INCIDENCE = 0.1
+# Approximates cohortextractor's "population_ages" distribution by the ratio of
+# patients in each age band. Ages in the "missing" band are over 120.
+POPULATION_AGES = {
+    "missing": 0.005,
+    "0-17": 0.125,
+    "18-29": 0.125,
+    "30-39": 0.125,
+    "40-49": 0.125,
+    "50-59": 0.125,
+    "60-69": 0.125,
+    "70-79": 0.125,
+    "80+": 0.12,
+}
+CHILDREN_POPULATION_AGES = {"0-5": 0.333, "6-10": 0.333, "11-17": 0.333}
+# The earliest event date in `study_definition`'s default expectations, used as the
+# start of codelist 2 windows with `time_ever`
+EVER_EARLIEST = "2020-01-01"
+
+
+def choose_categories(ratios, size, rng):
+    """
+    Choose categories in the given ratios, as cohortextractor's dummy data does
+    for "category" expectations. A category of None is missing.
+
+    Args:
+        ratios (dict): The ratio of each category.
+        size (int): The number of values to choose.
+        rng (np.random.Generator): The random number generator.
+
+    Returns:
+        np.ndarray: The chosen categories.
+    """
+    categories = np.array(list(ratios.keys()), dtype=object)
+    p = np.array(list(ratios.values()), dtype=float)
+    return categories[rng.choice(len(categories), size=size, p=p / p.sum())]
+
+
+def generate_variable(return_expectations, size, rng, missing=None):
+    """
+    Generate a variable from its `return_expectations`. Supports "category" and
+    normally distributed "int" expectations, with an "incidence".
+
+    Args:
+        return_expectations (dict): The variable's expectations, from `expectations`.
+        size (int): The number of values to generate.
+        rng (np.random.Generator): The random number generator.
+        missing: The value of the variable where it isn't present.
+
+    Returns:
+        np.ndarray: The generated values.
+    """
+    if "category" in return_expectations:
+        values = choose_categories(return_expectations["category"]["ratios"], size, rng)
+    elif return_expectations.get("int", {}).get("distribution") == "normal":
+        spec = return_expectations["int"]
+        values = np.rint(rng.normal(spec["mean"], spec["stddev"], size)).astype(int)
+    else:
+        raise ValueError(f"Unsupported expectations: {return_expectations}")
+
+    if "incidence" in return_expectations:
+        present = rng.random(size) < return_expectations["incidence"]
+        values = np.where(present, values, missing)
+    return values
+
+
+def generate_ages(size, rng, children=False):
+    """Generate ages in years, with the ratio of ages in each band of `POPULATION_AGES`."""
+    bands = CHILDREN_AGE_BANDS if children else AGE_BANDS
+    ratios = CHILDREN_POPULATION_AGES if children else POPULATION_AGES
+
+    labels = choose_categories(ratios, size, rng)
+    lower = np.full(size, 120)
+    upper = np.full(size, 125)
+    for label, low, high in zip(bands["labels"], bands["edges"], bands["edges"][1:]):
+        in_band = labels == label
+        lower[in_band] = low
+        upper[in_band] = high
+    return rng.integers(lower, upper)
+
+
+def random_dates(starts, ends, rng):
+    """
+    Choose a date uniformly between each start and end date, inclusive.
+
+    Args:
+        starts (np.ndarray): The earliest date of each value, as datetime64.
+        ends (np.ndarray): The latest date of each value, as datetime64.
+        rng (np.random.Generator): The random number generator.
+
+    Returns:
+        np.ndarray: The chosen dates, as datetime64[D].
+    """
+    starts = np.asarray(starts, dtype="datetime64[D]")
+    ends = np.asarray(ends, dtype="datetime64[D]")
+    days = (ends - starts).astype(int) + 1
+    return starts + np.floor(rng.random(len(days)) * days).astype(int)
+
+
+def format_dates(dates, present):
+    """
+    Format dates as YYYY-MM-DD strings, or None where they aren't present. Each
+    day in the range of the dates is only formatted once, as there are few of them.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    if len(dates) == 0:
+        return np.array([], dtype=object)
+    first = dates.min()
+    days = (dates - first).astype(int)
+    labels = (first + np.arange(days.max() + 1)).astype(str).astype(object)
+    formatted = labels[days]
+    formatted[~present] = None
+    return formatted
+
+
+def generate_patients(population_size, start_date, end_date, rng, children=False):
+    """
+    Generate the patients that every cohort is drawn from. Dates of birth are set
+    so that the ages on the start date follow `POPULATION_AGES`.
+
+    Args:
+        population_size (int): The number of patients.
+        start_date (str): The first index date.
+        end_date (str): The last index date.
+        rng (np.random.Generator): The random number generator.
+        children (bool): Whether to generate the ages of the children population.
+
+    Returns:
+        pd.DataFrame: One row for each patient.
+    """
+    start_date = pd.Timestamp(start_date)
+    ages = generate_ages(population_size, rng, children)
+    months = ages * 12 + rng.integers(0, 12, population_size)
+    date_of_birth = (
+        np.datetime64(start_date, "M") - months.astype("timedelta64[M]")
+    ).astype("datetime64[ns]")
+
+    def life_event_dates(incidence):
+        dates = random_dates(
+            np.full(population_size, np.datetime64(start_date, "D")),
+            np.full(population_size, np.datetime64(pd.Timestamp(end_date), "D")),
+            rng,
+        )
+        dates[rng.random(population_size) >= incidence] = np.datetime64("NaT")
+        return pd.to_datetime(dates)
+
+    return pd.DataFrame(
+        {
+            "patient_id": np.arange(1, population_size + 1),
+            "date_of_birth": date_of_birth,
+            "died_date": life_event_dates(DIED_INCIDENCE),
+            "deregistered_date": life_event_dates(DEREGISTERED_INCIDENCE),
+            "sex": generate_variable(expectations.SEX, population_size, rng),
+            "region": generate_variable(expectations.REGION, population_size, rng),
+            "imd_rank": np.round(
+                generate_variable(expectations.IMD_RANK, population_size, rng), -2
+            ),
+            "practice": generate_variable(
+                expectations.PRACTICE, population_size, rng, missing=0
+            ),
+        }
+    )
+
+
+def generate_events(codes, window_start, window_end, size, rng):
+    """
+    Generate the flag, code and date of an event in a window, following the
+    expectations of `event_variables`. The code and date are only present for
+    patients with the event.
+
+    Args:
+        codes (list): The codes of the event's codelist.
+        window_start (pd.Timestamp): The earliest date of the event.
+        window_end (pd.Timestamp): The latest date of the event.
+        size (int): The number of patients.
+        rng (np.random.Generator): The random number generator.
+
+    Returns:
+        tuple: The flag, code and date of each patient's event.
+    """
+    flag = rng.random(size) < expectations.EVENT_FLAG["incidence"]
+    code_ratios = {
+        code: ratio
+        for code, ratio in generate_expectations_codes(codes).items()
+        if code is not None
+    }
+    code = choose_categories(code_ratios, size, rng)
+    code[~flag] = None
+    date = random_dates(
+        np.full(size, np.datetime64(window_start, "D")),
+        np.full(size, np.datetime64(window_end, "D")),
+        rng,
+    )
+    return flag.astype(int), code, format_dates(date, flag)
+
+
+def generate_cohort(
+    patients,
+    index_date,
+    windows,
+    codelists,
+    rng,
+    population="all",
+    breakdowns=(),
+):
+    """
+    Generate the cohort `study_definition` would extract for an index date.
+
+    Args:
+        patients (pd.DataFrame): The patients from `generate_patients`.
+        index_date (pd.Timestamp): The index date.
+        windows (dict): The start and end of each event's window.
+        codelists (dict): The codes of each event's codelist.
+        rng (np.random.Generator): The random number generator.
+        population (str): "all", "adults" or "children".
+        breakdowns (list): The demographic breakdowns to include.
+
+    Returns:
+        pd.DataFrame: The cohort, with the columns in the order they are extracted.
+    """
+    age_years = age_in_years(patients["date_of_birth"], index_date)
+    # dummy patients are registered from before the first index date until they
+    # deregister
+    registered = patients["deregistered_date"].isna() | (
+        patients["deregistered_date"] > index_date
+    )
+    mask = in_population(
+        patients.assign(**{registration_column(index_date): registered.astype(int)}),
+        index_date,
+        age_years,
+        population,
+    )
+    cohort = patients.loc[mask, ["patient_id"]].assign(age_years=age_years[mask])
+
+    breakdown_variables = {RAW_VARIABLES.get(b, b) for b in breakdowns}
+    for variable in ["sex", "region", "imd_rank"]:
+        if variable in breakdown_variables:
+            cohort[variable] = patients.loc[mask, variable]
+    cohort["practice"] = patients.loc[mask, "practice"]
+
+    size = len(cohort)
+    for event_name, (window_start, window_end) in windows.items():
+        flag, code, date = generate_events(
+            codelists[event_name], window_start, window_end, size, rng
+        )
+        cohort[event_name] = flag
+        cohort[f"{event_name}_code"] = code
+        cohort[f"{event_name}_date"] = date
+
+    return cohort.reset_index(drop=True)
+
+
+def generate_ethnicity(patients, rng):
+    """Generate the cohort `study_definition_ethnicity` would extract."""
+    return pd.DataFrame(
+        {
+            "patient_id": patients["patient_id"],
+            "ethnicity": generate_variable(
+                expectations.ETHNICITY, len(patients), rng, missing="Missing"
+            ),
+        }
+    )
+
+
+def read_codes(codelist_path):
+    """Read the codes of an interactive codelist."""
+    return pd.read_csv(codelist_path, dtype={"code": str})["code"].tolist()
+
+
+def get_windows(index_date, frequency, comparison_date, days, ever):
+    """The start and end of each event's window for an index date."""
+    index_dates = pd.DatetimeIndex([index_date])
+    codelist_1_window = codelist_1_windows(index_dates, frequency)
+    codelist_2_window = codelist_2_windows(
+        index_dates, codelist_1_window, comparison_date, days
+    )
+    windows = {
+        "event_1": (codelist_1_window[0][0], codelist_1_window[1][0]),
+        "event_2": (codelist_2_window[0][0], codelist_2_window[1][0]),
+    }
+    if ever:
+        window_end = windows["event_2"][1]
+        windows["event_2"] = (min(pd.Timestamp(EVER_EARLIEST), window_end), window_end)
+    return windows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate dummy cohorts from the study definitions' expectations"
+    )
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--start-date", type=str, required=True)
+    parser.add_argument("--end-date", type=str, required=True)
+    parser.add_argument(
+        "--weekly-date",
+        action="append",
+        default=[],
+        help="Index date of a weekly cohort to generate. Can be given more than once",
+    )
+    parser.add_argument("--codelist-1-path", type=str, required=True)
+    parser.add_argument("--codelist-2-path", type=str, required=True)
+    parser.add_argument(
+        "--codelist-2-comparison-date",
+        choices=["start_date", "end_date"],
+        default="end_date",
+    )
+    parser.add_argument("--time-value", type=str, default="None")
+    parser.add_argument("--time-scale", type=str, default="")
+    parser.add_argument("--time-ever", action="store_true")
+    parser.add_argument(
+        "--population", choices=["all", "adults", "children"], default="all"
+    )
+    parser.add_argument(
+        "--breakdowns",
+        type=str,
+        default="sex,age,imd,region",
+        help="Comma separated breakdowns, as for the study definition's param",
+    )
+    parser.add_argument("--population-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    time_value = (
+        None
+        if args.time_value.lower().strip() in ("none", "")
+        else int(args.time_value)
+    )
+    time_scale = None if args.time_scale.lower() in ("none", "") else args.time_scale
+    days = time_to_days(time_value, time_scale)
+    breakdowns = args.breakdowns.split(",")
+    codelists = {
+        "event_1": read_codes(args.codelist_1_path),
+        "event_2": read_codes(args.codelist_2_path),
+    }
+
+    patients = generate_patients(
+        args.population_size,
+        args.start_date,
+        args.end_date,
+        np.random.default_rng([args.seed, 0]),
+        children=args.population == "children",
+    )
+    generate_ethnicity(patients, np.random.default_rng([args.seed, 1])).to_feather(
+        args.output_dir / "input_ethnicity.feather"
+    )
+
+    cohorts = [
+        ("monthly", index_date, f"input_{index_date:%Y-%m-%d}.feather")
+        for index_date in period_starts(args.start_date, args.end_date, "monthly")
+    ] + [
+        ("weekly", pd.Timestamp(date), f"input_weekly_{date}.feather")
+        for date in args.weekly_date
+    ]
+    for frequency, index_date, file_name in cohorts:
+        # each cohort has its own generator, so it doesn't depend on which other
+        # cohorts are generated
+        rng = np.random.default_rng(
+            [args.seed, 2 + (frequency == "weekly"), index_date.toordinal()]
+        )
+        windows = get_windows(
+            index_date,
+            frequency,
+            args.codelist_2_comparison_date,
+            days,
+            args.time_ever,
+        )
+        cohort = generate_cohort(
+            patients,
+            index_date,
+            windows,
+            codelists,
+            rng,
+            population=args.population,
+            breakdowns=breakdowns,
+        )
+        cohort.to_feather(args.output_dir / file_name)
+
+
+if __name__ == "__main__":
+    main()
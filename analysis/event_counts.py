@@ -1,9 +1,14 @@
 import argparse
-import functools
+import sys
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+from analysis.banding import POPULATIONS, filter_population
+from analysis.cohort_utils import check_cohort_schemas, read_cohorts
+from analysis.daily_counts import DailyCounts, update_from_cohort
+from analysis.disclosure import round_count
+from analysis.event_flags import EVENTS, OPERATORS, derive_event_flags, parse_operator
 from analysis.report_utils import (
     drop_zero_practices,
     get_date_input_file,
@@ -12,14 +17,6 @@ from analysis.report_utils import (
 )
 
 
-def round_to_nearest(x, *, base):
-    return base * round(x / base)
-
-
-round_to_nearest_100 = functools.partial(round_to_nearest, base=100)
-round_to_nearest_10 = functools.partial(round_to_nearest, base=10)
-
-
 def get_summary_stats(df):
     required_columns = {"patient_id", "event_measure", "practice"}
     assert required_columns.issubset(set(df.columns))
@@ -41,9 +38,92 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input-dir", type=str, required=True)
     parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument(
+        "--daily-counts",
+        type=str,
+        help=(
+            "Daily event counts to update from the monthly cohorts, for rolling "
+            "weekly or monthly counts. The latest week is still counted from the "
+            "weekly cohort"
+        ),
+    )
+    parser.add_argument(
+        "--operator",
+        type=parse_operator,
+        choices=list(OPERATORS),
+        default="AND",
+        help="How the events are combined into the measure",
+    )
+    parser.add_argument(
+        "--population",
+        choices=POPULATIONS,
+        default="all",
+        help=(
+            "The population to count the events of, selected by age from cohorts "
+            "extracted for all patients"
+        ),
+    )
     return parser.parse_args()
 
 
+def cohort_requirements(weekly=False, daily_counts=False, population="all"):
+    """
+    The columns the cohort files need for the event counts, for `check_cohort_schemas`.
+
+    Args:
+        weekly (bool): Whether the requirements are of the weekly cohort files, which
+            are only used for their events.
+        daily_counts (bool): Whether the monthly cohort files update the daily counts.
+        population (str): The population the cohorts are filtered to, by
+            `filter_population`.
+
+    Returns:
+        list: The requirements of the cohort files.
+    """
+    # each event's flag is derived from its date, if the flag wasn't extracted
+    requirements = [[(event, "flag"), (f"{event}_date", "date")] for event in EVENTS]
+    if not weekly:
+        requirements += [[("patient_id", "id")], [("practice", "number")]]
+        if daily_counts:
+            requirements += [[("event_1_date", "date")], [("event_2_date", "date")]]
+    if population != "all":
+        requirements.append([("age_years", "number")])
+    return requirements
+
+
+def check_input_files(input_dir, daily_counts=False, population="all"):
+    """
+    Check the schema of the cohort files without reading their data, and that there
+    are cohorts to count the latest month and week from.
+
+    Args:
+        input_dir (str): The directory containing the cohort files.
+        daily_counts (bool): Whether the monthly cohort files update the daily
+            counts.
+        population (str): The population the cohorts are filtered to.
+
+    Returns:
+        list: A description of each problem with the files.
+    """
+    files = list(Path(input_dir).rglob("*"))
+    monthly_files = [file for file in files if match_input_files(file.name)]
+    problems = check_cohort_schemas(
+        monthly_files,
+        cohort_requirements(daily_counts=daily_counts, population=population),
+    )
+    if not monthly_files:
+        problems.append(f"{input_dir}: no cohort files")
+    weekly_files = [file for file in files if match_input_files(file.name, weekly=True)]
+    problems += check_cohort_schemas(
+        weekly_files, cohort_requirements(weekly=True, population=population)
+    )
+    if not weekly_files:
+        problems.append(
+            f"{input_dir}: no weekly cohort files to count the latest week from"
+        )
+    return problems
+
+
 def generate_latest_week_range(latest_week_start):
     latest_week_start = pd.to_datetime(latest_week_start)
     latest_week_end = latest_week_start + pd.DateOffset(6)
@@ -55,20 +135,42 @@ def generate_latest_week_range(latest_week_start):
     return latest_week_range
 
 
-def main():
-    args = parse_args()
+def get_event_counts(
+    input_dir, daily_counts_path=None, operator="AND", population="all"
+):
+    """
+    Count the events, patients and practices in the cohorts for the summary table.
+
+    Args:
+        input_dir (str): The directory containing the cohort files.
+        daily_counts_path (str, optional): Daily event counts to update from the
+            monthly cohorts.
+        operator (str): One of `OPERATORS`, to combine the events into the measure.
+        population (str): One of `POPULATIONS`, to select from cohorts extracted
+            for all patients.
 
+    Returns:
+        dict: The rounded counts, as written to event_counts.json.
+    """
     patients = []
     patients_with_events = []
     practices = []
     practice_with_events = []
     events = {}
     events_weekly = {}
-
-    for file in Path(args.input_dir).rglob("*"):
+    daily_counts = None
+    if daily_counts_path:
+        daily_counts = DailyCounts.load(daily_counts_path, operator, population)
+
+    files = sorted(
+        file
+        for file in Path(input_dir).rglob("*")
+        if match_input_files(file.name) or match_input_files(file.name, weekly=True)
+    )
+    for file, df in read_cohorts(files):
+        df = derive_event_flags(filter_population(df, population), operator)
         if match_input_files(file.name):
             date = get_date_input_file(file.name)
-            df = pd.read_feather(file)
             df["date"] = date
 
             df_practices_dropped = drop_zero_practices(df, "event_measure")
@@ -79,40 +181,56 @@ def main():
             patients_with_events.extend(summary_stats["patients_with_events"])
             practices.extend(summary_stats["unique_practices"])
 
-        if match_input_files(file.name, weekly=True):
+            if daily_counts is not None:
+                update_from_cohort(daily_counts, df, file.name)
+
+        else:
             date = get_date_input_file(file.name, weekly=True)
-            df = pd.read_feather(file)
             df["date"] = date
             num_events = df.loc[:, "event_measure"].sum()
             events_weekly[date] = num_events
 
+    if daily_counts is not None:
+        daily_counts.save(daily_counts_path)
+
     # there should only be one key in events_weekly, but we take the max anyway
     latest_week = max(events_weekly.keys())
     latest_month = max(events.keys())
-    events_in_latest_week = round_to_nearest_100(events_weekly[latest_week])
-    total_events = round_to_nearest_100(sum(events.values()))
-    total_patients = round_to_nearest_100(len(np.unique(patients)))
-    unique_patients_with_events = round_to_nearest_100(
-        len(np.unique(patients_with_events))
-    )
-    total_practices = round_to_nearest_10(len(np.unique(practices)))
-    total_practices_with_events = round_to_nearest_10(
-        len(np.unique(practice_with_events))
+    events_in_latest_week = round_count(events_weekly[latest_week], 100)
+    total_events = round_count(sum(events.values()), 100)
+    total_patients = round_count(len(np.unique(patients)), 100)
+    unique_patients_with_events = round_count(len(np.unique(patients_with_events)), 100)
+    total_practices = round_count(len(np.unique(practices)), 10)
+    total_practices_with_events = round_count(len(np.unique(practice_with_events)), 10)
+    events_in_latest_period = round_count(events[max(events.keys())], 100)
+
+    return {
+        "total_events": total_events,
+        "total_patients": total_patients,
+        "unique_patients_with_events": unique_patients_with_events,
+        "events_in_latest_period": events_in_latest_period,
+        "total_practices": total_practices,
+        "total_practices_with_events": total_practices_with_events,
+        "events_in_latest_week": events_in_latest_week,
+        "latest_week": generate_latest_week_range(latest_week),
+        "latest_month": pd.to_datetime(latest_month).strftime("%Y-%m"),
+    }
+
+
+def main():
+    args = parse_args()
+
+    # check the schema of every cohort file before any are read
+    problems = check_input_files(
+        args.input_dir, args.daily_counts is not None, args.population
     )
-    events_in_latest_period = round_to_nearest_100(events[max(events.keys())])
+    if problems:
+        sys.exit("Can't count the events in the cohorts:\n" + "\n".join(problems))
 
     save_to_json(
-        {
-            "total_events": total_events,
-            "total_patients": total_patients,
-            "unique_patients_with_events": unique_patients_with_events,
-            "events_in_latest_period": events_in_latest_period,
-            "total_practices": total_practices,
-            "total_practices_with_events": total_practices_with_events,
-            "events_in_latest_week": events_in_latest_week,
-            "latest_week": generate_latest_week_range(latest_week),
-            "latest_month": pd.to_datetime(latest_month).strftime("%Y-%m"),
-        },
+        get_event_counts(
+            args.input_dir, args.daily_counts, args.operator, args.population
+        ),
         f"{args.output_dir}/event_counts.json",
     )
 
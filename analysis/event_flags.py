@@ -0,0 +1,162 @@
+import argparse
+import operator
+import sys
+from pathlib import Path
+
+from analysis.cohort_utils import read_cohort
+from analysis.report_utils import match_input_files
+
+
+EVENTS = ["event_1", "event_2"]
+
+# Combine the (0 or 1) flags of two events
+OPERATORS = {
+    "AND": operator.and_,
+    "OR": operator.or_,
+    "AND NOT": lambda flag_1, flag_2: flag_1 & (1 - flag_2),
+}
+
+
+def parse_operator(name):
+    """
+    Parse the name of one of `OPERATORS`, in any case and with an underscore or a
+    space in "AND NOT".
+    """
+    name = name.upper().replace("_", " ")
+    if name not in OPERATORS:
+        raise ValueError(f"unknown operator: {name}")
+    return name
+
+
+def derive_event_flags(df, operator="AND"):
+    """
+    Derive the binary flags from the date columns of a cohort, for cohorts extracted
+    with `derive_flags`. Flags that were extracted are left as they are.
+
+    The measure isn't extracted, so that it can be of any of the `OPERATORS`
+    without extracting the cohort again; it's always combined from the flags here.
+
+    Args:
+        df (pd.DataFrame): A cohort. Should contain columns "event_1_date" and "event_2_date".
+        operator (str): One of `OPERATORS`, to combine the flags into the measure.
+
+    Returns:
+        pd.DataFrame: The cohort with "event_1", "event_2" and "event_measure" columns.
+    """
+    for event in EVENTS:
+        if event not in df.columns:
+            df[event] = df[f"{event}_date"].notna().astype(int)
+
+    df["event_measure"] = (
+        OPERATORS[operator](df["event_1"].astype(int), df["event_2"].astype(int))
+    ).astype(int)
+
+    return df
+
+
+def event_flag(df, event):
+    """The flag of an event, derived from its date column if it wasn't extracted."""
+    if event in df.columns:
+        return df[event].astype(int)
+    return df[f"{event}_date"].notna().astype(int)
+
+
+def parse_numerator(definition):
+    """
+    Parse a numerator definition of the form `name:event_1:event_2[:operator]`.
+
+    `event_1` and `event_2` are the names of the events the numerator combines, such
+    as "event_1" or "asthma_review", whose flag (or date) and code columns are in the
+    cohort. The operator is one of `OPERATORS`, and defaults to AND.
+
+    Returns:
+        dict: The "name", "event_1", "event_2" and "operator" of the numerator.
+    """
+    name, event_1, event_2, *rest = definition.split(":")
+    return {
+        "name": name,
+        "event_1": event_1,
+        "event_2": event_2,
+        "operator": parse_operator(rest[0]) if rest else "AND",
+    }
+
+
+def operator_numerator(operator):
+    """
+    The numerator of event 1 and event 2 combined with an operator, named after the
+    operator, e.g. "and_not", for calculating the measure with several operators.
+    """
+    return {
+        "name": operator.lower().replace(" ", "_"),
+        "event_1": "event_1",
+        "event_2": "event_2",
+        "operator": operator,
+    }
+
+
+def numerator_column(numerator):
+    """The name of the column `add_numerator_flags` adds for a numerator."""
+    return f"numerator_{numerator['name']}"
+
+
+def add_numerator_flags(df, numerators):
+    """
+    Add a flag for each numerator, combining the flags of its events with its operator.
+
+    Args:
+        df (pd.DataFrame): A cohort containing the events of each numerator.
+        numerators (list): Numerators from `parse_numerator`.
+
+    Returns:
+        pd.DataFrame: The cohort with a `numerator_column` for each numerator.
+    """
+    for numerator in numerators:
+        combine = OPERATORS[numerator["operator"]]
+        df[numerator_column(numerator)] = combine(
+            event_flag(df, numerator["event_1"]), event_flag(df, numerator["event_2"])
+        ).astype(int)
+    return df
+
+
+def compare_derived_flags(df):
+    """
+    Compare the extracted flags of a cohort with those derived from its date columns.
+
+    Args:
+        df (pd.DataFrame): A cohort with both the flag and date columns extracted.
+
+    Returns:
+        dict: The number of patients whose derived flag differs from the extracted
+            one, for each flag.
+    """
+    derived = derive_event_flags(df[[f"{event}_date" for event in EVENTS]].copy())
+    return {
+        flag: int((derived[flag] != df[flag].astype(int)).sum())
+        for flag in [*EVENTS, "event_measure"]
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Check that flags derived from dates match the extracted flags"
+    )
+    parser.add_argument("--input-dir", type=str, required=True)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    mismatched = False
+    for file in sorted(Path(args.input_dir).iterdir()):
+        if match_input_files(file.name):
+            mismatches = compare_derived_flags(read_cohort(file))
+            print(f"{file.name}: {mismatches}")
+            mismatched = mismatched or any(mismatches.values())
+
+    if mismatched:
+        sys.exit("Derived flags don't match the extracted flags")
+
+
+if __name__ == "__main__":
+    main()
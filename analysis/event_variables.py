@@ -1,8 +1,9 @@
 from cohortextractor import patients
+from expectations import EVENT_FLAG
 from report_utils import generate_expectations_codes
 
 
-def clinical_event(codelist, date_range, event_name, ever=False):
+def clinical_event(codelist, date_range, event_name, ever=False, flag=True):
     """
     Returns a dictionary of event variables using `with_these_clinical_events` for a given codelist and date range.
 
@@ -11,6 +12,8 @@ def clinical_event(codelist, date_range, event_name, ever=False):
         date_range (tuple): A list of two dates in the format YYYY-MM-DD.
         event_name (str): The name of the event.
         ever (bool): Whether to overwrite the date range to be on_or_before the end date.
+        flag (bool): Whether to extract the binary flag. The flag is the same as the date not
+            being null, so can instead be derived after extraction with `derive_event_flags`.
     """
     if ever:
         date_kwargs = {"on_or_before": date_range[1]}
@@ -24,7 +27,7 @@ def clinical_event(codelist, date_range, event_name, ever=False):
                 codelist=codelist,
                 **date_kwargs,
                 returning="binary_flag",
-                return_expectations={"incidence": 0.5},
+                return_expectations=EVENT_FLAG,
             )
         ),
         f"{event_name}_code": (
@@ -54,10 +57,13 @@ def clinical_event(codelist, date_range, event_name, ever=False):
         ),
     }
 
+    if not flag:
+        del events[event_name]
+
     return events
 
 
-def medication_event(codelist, date_range, event_name, ever=False):
+def medication_event(codelist, date_range, event_name, ever=False, flag=True):
     """
     Returns a dictionary of event variables using `with_these_medications` for a given codelist and date range.
 
@@ -66,6 +72,8 @@ def medication_event(codelist, date_range, event_name, ever=False):
         date_range (tuple): A list of two dates in the format YYYY-MM-DD.
         event_name (str): The name of the event.
         ever (bool): Whether to overwrite the date range to be on_or_before the end date.
+        flag (bool): Whether to extract the binary flag. The flag is the same as the date not
+            being null, so can instead be derived after extraction with `derive_event_flags`.
     """
     if ever:
         date_kwargs = {"on_or_before": date_range[1]}
@@ -79,7 +87,7 @@ def medication_event(codelist, date_range, event_name, ever=False):
                 codelist=codelist,
                 **date_kwargs,
                 returning="binary_flag",
-                return_expectations={"incidence": 0.5},
+                return_expectations=EVENT_FLAG,
             )
         ),
         f"{event_name}_code": (
@@ -109,6 +117,57 @@ def medication_event(codelist, date_range, event_name, ever=False):
         ),
     }
 
+    if not flag:
+        del events[event_name]
+
+    return events
+
+
+def period_events(codelist_type, codelist, windows, event_name):
+    """
+    Returns a dictionary of variables for the date and code of a patient's latest event
+    in each window, `{event_name}_date_{i}` and `{event_name}_code_{i}` for the ith
+    window. `analysis.binning` only uses the latest event in each period's window, so
+    extracting it for each window, rather than each of a patient's events, means none
+    are missed however many events a patient has.
+
+    Args:
+        codelist_type (str): "event" or "medication".
+        codelist (Codelist): A codelist object.
+        windows (list): The start and end of each window, inclusive, as dates in the
+            format YYYY-MM-DD or expressions such as "event_1_date_1 - 28 days". A
+            start of None is any time on or before the end.
+        event_name (str): The name of the event.
+    """
+    if codelist_type == "event":
+        query = patients.with_these_clinical_events
+    elif codelist_type == "medication":
+        query = patients.with_these_medications
+    else:
+        raise Exception(f"unknown codelist_type: {codelist_type}")
+
+    events = {}
+    for i, (start, end) in enumerate(windows, start=1):
+        period = {"on_or_before": end} if start is None else {"between": [start, end]}
+        events[f"{event_name}_date_{i}"] = query(
+            codelist=codelist,
+            **period,
+            returning="date",
+            date_format="YYYY-MM-DD",
+            find_last_match_in_period=True,
+            return_expectations={"incidence": 0.5},
+        )
+        events[f"{event_name}_code_{i}"] = query(
+            codelist=codelist,
+            **period,
+            returning="code",
+            find_last_match_in_period=True,
+            return_expectations={
+                "category": {"ratios": generate_expectations_codes(codelist)},
+                "incidence": 0.5,
+            },
+        )
+
     return events
 
 
@@ -120,32 +179,41 @@ def generate_event_variables(
     codelist_2,
     codelist_2_date_range,
     ever=False,
+    derive_flags=False,
 ):
+    """
+    Returns a dictionary of the event variables for both codelists.
+
+    The measure isn't extracted: `event_measure` is combined from the event flags
+    after extraction by `derive_event_flags`, with the study's operator, so that
+    changing the operator doesn't need a new extraction.
+
+    If `derive_flags` is True, only the code and date of each event are extracted.
+    `event_1` and `event_2` are then derived from the dates by `derive_event_flags`
+    too.
+    """
+    flag = not derive_flags
+
     if codelist_1_type == "event":
-        event_1 = clinical_event(codelist_1, codelist_1_date_range, "event_1")
+        event_1 = clinical_event(
+            codelist_1, codelist_1_date_range, "event_1", flag=flag
+        )
     elif codelist_1_type == "medication":
-        event_1 = medication_event(codelist_1, codelist_1_date_range, "event_1")
+        event_1 = medication_event(
+            codelist_1, codelist_1_date_range, "event_1", flag=flag
+        )
     else:
         raise Exception(f"unknown codelist_1_type: {codelist_1_type}")
 
     if codelist_2_type == "event":
         event_2 = clinical_event(
-            codelist_2, codelist_2_date_range, "event_2", ever=ever
+            codelist_2, codelist_2_date_range, "event_2", ever=ever, flag=flag
         )
     elif codelist_2_type == "medication":
         event_2 = medication_event(
-            codelist_2, codelist_2_date_range, "event_2", ever=ever
+            codelist_2, codelist_2_date_range, "event_2", ever=ever, flag=flag
         )
     else:
         raise Exception(f"unknown codelist_2_type: {codelist_2_type}")
 
-    measure_variable = {
-        "event_measure": (
-            patients.satisfying(
-                " event_1 = 1 AND event_2 = 1",
-                return_expectations={"incidence": 0.5},
-            )
-        ),
-    }
-
-    return {**event_1, **event_2, **measure_variable}
+    return {**event_1, **event_2}
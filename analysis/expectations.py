@@ -0,0 +1,52 @@
+# The `return_expectations` of the study definitions' variables, kept here without
+# importing cohortextractor so that `dummy_data` can generate cohorts from them.
+
+SEX = {
+    "rate": "universal",
+    "category": {"ratios": {"M": 0.49, "F": 0.5, "U": 0.01}},
+}
+
+REGION = {
+    "category": {
+        "ratios": {
+            "North East": 0.1,
+            "North West": 0.1,
+            "Yorkshire and the Humber": 0.1,
+            "East Midlands": 0.1,
+            "West Midlands": 0.1,
+            "East of England": 0.1,
+            "London": 0.2,
+            "South East": 0.2,
+        }
+    }
+}
+
+IMD_RANK = {
+    "rate": "universal",
+    "int": {"distribution": "normal", "mean": 16000, "stddev": 8000},
+}
+
+AGE_YEARS = {
+    "rate": "universal",
+    "int": {"distribution": "population_ages"},
+}
+
+PRACTICE = {
+    "int": {"distribution": "normal", "mean": 25, "stddev": 5},
+    "incidence": 0.5,
+}
+
+ETHNICITY = {
+    "category": {
+        "ratios": {
+            "White": 0.2,
+            "Mixed": 0.2,
+            "South Asian": 0.2,
+            "Black": 0.2,
+            "Other": 0.2,
+        }
+    },
+    "incidence": 0.4,
+}
+
+EVENT_FLAG = {"incidence": 0.5}
@@ -0,0 +1,230 @@
+import argparse
+import json
+import threading
+from functools import lru_cache, partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+from analysis.measure_store import FIELDS, MeasureStore
+from analysis.report_utils import get_quantiles
+
+
+class QueryError(Exception):
+    """A query that can't be answered, with the HTTP status to answer it with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json_list(values):
+    """A list of floats for JSON, with null for NaNs."""
+    return [float(value) if np.isfinite(value) else None for value in values]
+
+
+class MeasureService:
+    """
+    Answers queries of a study's measure store, written by `measures.py`. The store
+    is memory-mapped, so only the rows and periods that are queried are read from
+    disk, and responses are kept in an LRU cache.
+
+    Before each query the modification times of the store's files are checked, and
+    if any have changed the store is reopened and the cache emptied, so a service
+    left running picks up the outputs of a new run of `measures.py`.
+    """
+
+    def __init__(self, store_dir, cache_size=256):
+        self.store_dir = Path(store_dir)
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self.reload_if_changed()
+
+    def _file_mtimes(self):
+        return {
+            path.name: path.stat().st_mtime_ns
+            for path in sorted(self.store_dir.iterdir())
+            if path.suffix in (".json", ".npy")
+        }
+
+    def reload_if_changed(self):
+        """
+        Reopen the store if its files have changed since it was opened.
+
+        Returns:
+            bool: Whether the store was reopened.
+        """
+        with self._lock:
+            mtimes = self._file_mtimes()
+            if mtimes == self._mtimes:
+                return False
+            # a cache for each load, so responses from the old files are never used,
+            # and queries answered while the store is reopened use one or the other
+            self._cached_query = lru_cache(maxsize=self.cache_size)(
+                partial(self._answer, MeasureStore(self.store_dir))
+            )
+            self._mtimes = mtimes
+            return True
+
+    def query(self, path, params):
+        """
+        Answer a query, from the cache if it has been answered before.
+
+        Args:
+            path (str): The query, one of "/groups", "/measures" or "/deciles".
+            params (dict): The query parameters, as lists of values as `parse_qs`
+                returns them.
+
+        Returns:
+            bytes: The JSON response.
+        """
+        self.reload_if_changed()
+        cached_query = self._cached_query
+        # parameters are normalised, so equivalent queries share a cache entry
+        key = tuple(sorted((name, tuple(values)) for name, values in params.items()))
+        return cached_query(path, key)
+
+    def _answer(self, store, path, key):
+        params = dict(key)
+        if path == "/groups":
+            response = {
+                "periods": self._period_strings(store.periods),
+                "groups": {group: store.values(group) for group in store.groups},
+            }
+        elif path == "/measures":
+            response = self._measures(store, params)
+        elif path == "/deciles":
+            response = self._deciles(store, params)
+        else:
+            raise QueryError(f"No such query: {path}", status=404)
+        return json.dumps(response).encode()
+
+    def _period_strings(self, periods):
+        return [str(period.date()) for period in periods]
+
+    def _periods(self, store, params):
+        """The columns of the periods between the start and end dates, inclusive."""
+        try:
+            start = pd.Timestamp(params.get("start", [store.periods.min()])[0])
+            end = pd.Timestamp(params.get("end", [store.periods.max()])[0])
+        except ValueError as e:
+            raise QueryError(f"Invalid date: {e}")
+        return np.flatnonzero((store.periods >= start) & (store.periods <= end))
+
+    def _measures(self, store, params):
+        """
+        The series of a group's values between two dates.
+
+        Parameters:
+            group: The group, e.g. "region".
+            values (optional): The values of the group, e.g. "London". Can be given
+                more than once. Defaults to all of them.
+            start, end (optional): The first and last periods, e.g. "2021-01-01".
+            field (optional): One of `FIELDS`. Can be given more than once. Defaults
+                to all of them.
+        """
+        if "group" not in params:
+            raise QueryError("No group")
+        group = params["group"][0]
+        if group not in store.groups:
+            raise QueryError(f"No such group: {group}", status=404)
+
+        group_values = store.values(group)
+        values = params.get("values", [v for v in group_values if v is not None])
+        missing = [value for value in values if value not in group_values]
+        if missing:
+            raise QueryError(f"No such values of {group}: {missing}", status=404)
+
+        fields = params.get("field", FIELDS)
+        unknown = [field for field in fields if field not in FIELDS]
+        if unknown:
+            raise QueryError(f"No such fields: {unknown}")
+
+        columns = self._periods(store, params)
+        rows = [group_values.index(value) for value in values]
+        series = {value: {} for value in values}
+        for field in fields:
+            # only the selected rows and periods are read from the memory-map
+            matrix = store.matrix(group, field)[np.ix_(rows, columns)]
+            for value, row in zip(values, matrix):
+                series[value][field] = to_json_list(row)
+
+        return {
+            "group": group,
+            "periods": self._period_strings(store.periods[columns]),
+            "series": series,
+        }
+
+    def _deciles(self, store, params):
+        """
+        The deciles, and outer percentiles, of the practice rates between two dates.
+
+        Parameters:
+            start, end (optional): The first and last periods, e.g. "2021-01-01".
+        """
+        if not store.has_practice_percentiles:
+            raise QueryError("The measures have no practice rates", status=404)
+
+        columns = self._periods(store, params)
+        percentiles = np.round(get_quantiles() * 100)
+        values = store.practice_percentiles(percentiles, columns)
+        return {
+            "periods": self._period_strings(store.periods[columns]),
+            "percentiles": percentiles.tolist(),
+            "values": [to_json_list(row) for row in values],
+        }
+
+
+def make_handler(service):
+    """A request handler class that answers GET requests with `service`."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                body = service.query(url.path, parse_qs(url.query))
+                status = 200
+            except QueryError as e:
+                body = json.dumps({"error": str(e)}).encode()
+                status = e.status
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serve a study's measures as JSON, for dashboards"
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        required=True,
+        help="The study output directory, with the measure store in joined/",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--cache-size", type=int, default=256, help="Number of responses to cache"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    service = MeasureService(args.output_dir / "joined/measure_store", args.cache_size)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving measures on http://{args.host}:{server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
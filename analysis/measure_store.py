@@ -0,0 +1,163 @@
+import json
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from analysis.report_utils import practice_percentiles
+
+
+FIELDS = ["numerator", "denominator", "rate"]
+# the percentiles of the practice rates stored in place of the rates themselves
+PRACTICE_PERCENTILES = "practice_percentiles"
+PERCENTILES = [*range(1, 10), *range(10, 100, 10), *range(91, 100)]
+
+
+def replace_file(path, write):
+    """
+    Write a file by writing a temporary file and renaming it over `path`, so that
+    readers that have the old file open, or memory-mapped, keep reading it intact.
+    The temporary file's name is unique, so that concurrent writers of the same
+    file don't write to the same temporary file, and it's removed if writing fails.
+    """
+    temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temporary, "xb") as f:
+            write(f)
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+def percentile_label(percentile):
+    """The value of a percentile in the `PRACTICE_PERCENTILES` group, e.g. "10"."""
+    return f"{percentile:g}"
+
+
+def write_measure_store(measure_df, path, practice_rates=True):
+    """
+    Write the measure table as a dense array for each group, alongside the long table
+    in measure_all.csv. Each group's array has a (group value × period) matrix for
+    each of `FIELDS`, with NaN rates where they're redacted or there's no count. The
+    periods, and the values of each group, are in index.json.
+
+    Args:
+        measure_df (pd.DataFrame): The redacted measure table from `write_measures`.
+        path (str): The directory to write the store to.
+        practice_rates (bool): Whether to store the rate of each practice. If not,
+            only the `PERCENTILES` of the practice rates are stored, as the
+            `PRACTICE_PERCENTILES` group, with NaN numerators and denominators.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    if measure_df.empty:
+        # with no counts, such as when no cohort has any patients, the store has no
+        # periods or groups. The empty table doesn't have every column
+        periods, groups = pd.Index([]), []
+    else:
+        periods = pd.Index(np.sort(measure_df["date"].unique()))
+        groups = measure_df["group"].unique()
+
+    index = {"periods": [str(pd.Timestamp(p).date()) for p in periods], "groups": {}}
+    for group in groups:
+        group_df = measure_df.loc[measure_df["group"] == group, :]
+        # values are in the order they're in the measure table, as they're plotted
+        values = pd.unique(group_df["group_value"])
+        rows = pd.Index(values).get_indexer(group_df["group_value"])
+        columns = periods.get_indexer(group_df["date"])
+
+        array = np.full((len(FIELDS), len(values), len(periods)), np.nan)
+        array[0, rows, columns] = group_df["event_measure"].astype(float)
+        array[1, rows, columns] = group_df["population"].astype(float)
+        array[2, rows, columns] = pd.to_numeric(group_df["value"], errors="coerce")
+
+        if group == "practice" and not practice_rates:
+            group = PRACTICE_PERCENTILES
+            values = [percentile_label(p) for p in PERCENTILES]
+            rates = practice_percentiles(array[2], PERCENTILES)
+            array = np.full((len(FIELDS), len(values), len(periods)), np.nan)
+            array[2] = rates
+
+        file_name = f"{group}.npy"
+        replace_file(path / file_name, lambda f: np.save(f, array))
+        index["groups"][group] = {
+            "file": file_name,
+            # as they're written to measure_all.csv, with null for missing values
+            "values": [None if pd.isna(value) else str(value) for value in values],
+        }
+
+    # the index is written last, so it's never ahead of the arrays
+    replace_file(path / "index.json", lambda f: f.write(json.dumps(index).encode()))
+
+
+class MeasureStore:
+    """
+    Reads a store written by `write_measure_store`. The arrays are memory-mapped, so
+    a group's matrix, or the series of one of its values, is a view of the file
+    rather than a copy.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "index.json") as f:
+            self.index = json.load(f)
+        self.periods = pd.DatetimeIndex(self.index["periods"])
+        self._arrays = {}
+
+    @property
+    def groups(self):
+        return list(self.index["groups"])
+
+    def values(self, group):
+        """The values of a group, in the order of the rows of its matrices."""
+        return self.index["groups"][group]["values"]
+
+    def matrix(self, group, field="rate"):
+        """
+        The (group value × period) matrix of a group.
+
+        Args:
+            group (str): The group, e.g. "region".
+            field (str): One of `FIELDS`.
+
+        Returns:
+            np.ndarray: A read-only view of the matrix.
+        """
+        if group not in self._arrays:
+            file_name = self.index["groups"][group]["file"]
+            self._arrays[group] = np.load(self.path / file_name, mmap_mode="r")
+        return self._arrays[group][FIELDS.index(field)]
+
+    def series(self, group, value, field="rate"):
+        """The values of one group value for each period, as a view of its matrix."""
+        return self.matrix(group, field)[self.values(group).index(value)]
+
+    @property
+    def has_practice_percentiles(self):
+        return bool({"practice", PRACTICE_PERCENTILES} & set(self.groups))
+
+    def practice_percentiles(self, percentiles, columns=slice(None)):
+        """
+        Percentiles of the practice rates for each period. They're computed from
+        the practice matrix, or read from the `PRACTICE_PERCENTILES` group if only
+        the percentiles were stored, in which case they must be in `PERCENTILES`.
+
+        Args:
+            percentiles (list): The percentiles, between 0 and 100.
+            columns: The periods, as an index of the columns of the matrices.
+
+        Returns:
+            np.ndarray: A (percentile × period) matrix, with NaN for periods where
+                no practice has a rate.
+        """
+        if "practice" in self.index["groups"]:
+            return practice_percentiles(
+                self.matrix("practice")[:, columns], percentiles
+            )
+
+        values = self.values(PRACTICE_PERCENTILES)
+        rows = [values.index(percentile_label(p)) for p in percentiles]
+        return np.array(self.matrix(PRACTICE_PERCENTILES)[:, columns][rows])
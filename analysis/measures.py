@@ -1,16 +1,78 @@
 import argparse
+import json
+import sys
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from analysis.banding import (
+    AGE_BANDS,
+    CHILDREN_AGE_BANDS,
+    IMD_QUINTILES,
+    POPULATIONS,
+    RAW_VARIABLES,
+    add_bands,
+    age_bands,
+    filter_population,
+    imd_bands,
+)
+from analysis.cohort_utils import (
+    ETHNICITY_REQUIREMENTS,
+    check_cohort_schemas,
+    lookup_patients,
+    read_cohorts,
+    read_ethnicity_lookup,
+)
+from analysis.denominator_cache import (
+    DenominatorCache,
+    cohort_digest,
+    file_digest,
+    population_key,
+    to_json_value,
+)
+from analysis.disclosure import redact_low_values, round_to_base
+from analysis.event_flags import (
+    EVENTS,
+    OPERATORS,
+    add_numerator_flags,
+    derive_event_flags,
+    numerator_column,
+    operator_numerator,
+    parse_numerator,
+    parse_operator,
+)
+from analysis.measure_store import replace_file, write_measure_store
 from analysis.report_utils import calculate_rate, get_date_input_file, match_input_files
+from pandas.api.types import is_float_dtype
+
+
+FILTERS = {
+    "sex": ["M", "F"],
+    "age_band": [
+        "0-5",
+        "6-10",
+        "11-17",
+        "18-29",
+        "30-39",
+        "40-49",
+        "50-59",
+        "60-69",
+        "70-79",
+        "80+",
+    ],
+}
+
+# the breakdowns by the code of each event of a numerator
+CODE_BREAKDOWNS = {"event_1_code": "event_1", "event_2_code": "event_2"}
 
 
 def redact_and_round_column(df, col, decimals=-1):
     """Redact values less-than or equal-to 10 and then round values to nearest 10."""
-    df[col] = df[col].apply(lambda x: x if x > 10 else 0)
-    # `Series.round` introduces scaling and precision errors, meaning some numbers
-    # aren't rounded. This isn't the case for the `round` builtin.
-    df[col] = df[col].apply(round, ndigits=decimals)
+    rounded = round_to_base(redact_low_values(df[col], 10), 10**-decimals)
+    # counts stay ints, as they are with the `round` builtin
+    df[col] = rounded if is_float_dtype(df[col]) else rounded.astype(int)
     return df
 
 
@@ -62,7 +124,52 @@ def calculate_total_counts(df, date, group=None, group_value=None):
     return pd.DataFrame.from_records([row_dict])
 
 
-def calculate_group_counts(df, breakdown, date):
+def aggregate_groups(df, column, flags, date, denominators=None):
+    """
+    Sum each flag, and count the patients, for each value of a column, as
+    `df.groupby(column)[flags].agg(["sum", "count"])` does.
+
+    If a denominator cache is given, the counts are looked up in it and only the
+    flags are summed. Counts it doesn't have are counted and added to it. The
+    counts of a column must not depend on the codelists, so code columns can't be
+    cached.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame. The flags should never be missing.
+        column (str): The name of the column to group by.
+        flags (list): The names of the flags to sum.
+        date (str): The date of the input file.
+        denominators (DenominatorCache, optional): The denominator cache.
+
+    Returns:
+        pd.DataFrame: A "sum" and "count" column for each flag, indexed by the values
+            of the column.
+    """
+    grouped = df.groupby(by=[column], observed=True)[flags]
+    if denominators is None:
+        return grouped.agg(["sum", "count"])
+
+    patients = cohort_digest(df)
+    cached = denominators.get(column, date, patients)
+    if cached is not None:
+        sums = grouped.sum()
+        counts = [cached.get(to_json_value(value)) for value in sums.index]
+        if None not in counts:
+            counts = np.array(counts, dtype=np.int64)
+            return pd.concat(
+                {
+                    flag: pd.DataFrame({"sum": sums[flag], "count": counts})
+                    for flag in flags
+                },
+                axis=1,
+            )
+
+    aggregated = grouped.agg(["sum", "count"])
+    denominators.put(column, date, patients, aggregated[flags[0]]["count"])
+    return aggregated
+
+
+def calculate_group_counts(df, breakdown, date, denominators=None):
     """
     Calculate the counts for a specified group.
 
@@ -70,13 +177,16 @@ def calculate_group_counts(df, breakdown, date):
         df (pd.DataFrame): The input DataFrame. Should contain a column named "breakdown".
         breakdown (str): The name of the column to group by.
         date (str): The date of the input file.
+        denominators (DenominatorCache, optional): A cache of the population counts.
+            See `aggregate_groups`.
 
     Returns:
         pd.DataFrame: A DataFrame containing the counts for the specified group.
     """
     counts = (
-        df.groupby(by=[breakdown])["event_measure"]
-        .agg(["sum", "count"])
+        aggregate_groups(df, breakdown, ["event_measure"], date, denominators)[
+            "event_measure"
+        ]
         .reset_index()
         .rename(
             columns={
@@ -94,6 +204,77 @@ def calculate_group_counts(df, breakdown, date):
     return counts
 
 
+def calculate_practice_counts(df):
+    """
+    Count the events and patients of each practice with `np.bincount`.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame. Should contain columns "practice" and
+            "event_measure".
+
+    Returns:
+        tuple: The practices, and the number of events and patients of each.
+    """
+    df = df.loc[df["practice"].notna(), :]
+    practices, positions = np.unique(df["practice"].to_numpy(), return_inverse=True)
+    events = np.bincount(
+        positions, weights=df["event_measure"], minlength=len(practices)
+    )
+    patients = np.bincount(positions, minlength=len(practices))
+    return practices, events.astype(df["event_measure"].dtype), patients
+
+
+def practice_matrix(practice_counts):
+    """
+    Combine the practice counts of each cohort into (practice × date) matrices. A
+    practice has no patients on the dates it wasn't in the cohort.
+
+    Args:
+        practice_counts (dict): The counts from `calculate_practice_counts`, for the
+            date of each cohort.
+
+    Returns:
+        tuple: The practices, the dates, and the matrices of the number of events and
+            patients.
+    """
+    dates = sorted(practice_counts)
+    practices = np.unique(
+        np.concatenate([practices for practices, _, _ in practice_counts.values()])
+    )
+    shape = (len(practices), len(dates))
+    events = np.zeros(
+        shape,
+        dtype=np.result_type(*(events for _, events, _ in practice_counts.values())),
+    )
+    patients = np.zeros(shape, dtype=np.int64)
+    for column, date in enumerate(dates):
+        date_practices, date_events, date_patients = practice_counts[date]
+        rows = np.searchsorted(practices, date_practices)
+        events[rows, column] = date_events
+        patients[rows, column] = date_patients
+    return practices, dates, events, patients
+
+
+def practice_rows(practices, dates, events, patients):
+    """
+    The rows of the measure table for the practice group, from `practice_matrix`.
+    There's a row for each practice on each date it has patients.
+
+    Returns:
+        pd.DataFrame: The counts, with the columns `calculate_group_counts` returns.
+    """
+    rows, columns = np.nonzero(patients)
+    return pd.DataFrame(
+        {
+            "date": np.asarray(dates, dtype=object)[columns],
+            "event_measure": events[rows, columns],
+            "population": patients[rows, columns],
+            "group": "practice",
+            "group_value": practices[rows],
+        }
+    )
+
+
 def calculate_and_redact_values(df):
     """
     Calculate the values for each group and redact where necessary.
@@ -129,65 +310,659 @@ def calculate_and_redact_values(df):
     return result
 
 
-def parse_args():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--breakdowns", action="append", default=[], required=False)
-    parser.add_argument("--input-dir", type=str, required=True)
-    return parser.parse_args()
+def parse_shard(shard):
+    """
+    Parse a shard of the cohort files, of the form `i/N`: the ith of N shards,
+    counting from 1.
 
+    Returns:
+        tuple: i and N.
+    """
+    index, count = (int(part) for part in shard.split("/"))
+    if not 1 <= index <= count:
+        raise ValueError(f"not one of {count} shards: {index}")
+    return index, count
 
-def main():
-    args = parse_args()
-    breakdowns = args.breakdowns
 
-    breakdowns.extend(["practice", "event_1_code", "event_2_code"])
+def input_files(input_dir, shard=None):
+    """
+    The cohort files in a directory.
+
+    Args:
+        input_dir (str): The directory containing the cohort files.
+        shard (tuple, optional): A shard from `parse_shard`. If given, only the
+            shard's files are returned: every Nth file in date order, from the ith.
+            The shards only depend on the files, so a shard that fails can be run
+            again and count the same files.
 
+    Returns:
+        list: The paths of the files, in date order.
+    """
+    files = sorted(
+        file for file in Path(input_dir).iterdir() if match_input_files(file.name)
+    )
+    if shard is not None:
+        index, count = shard
+        files = files[index - 1 :: count]
+    return files
+
+
+def cohort_requirements(
+    breakdowns, numerators=None, ethnicity_lookup=False, population="all"
+):
+    """
+    The columns the cohort files need for the measures, for `check_cohort_schemas`.
+
+    Args:
+        breakdowns (list): The names of the columns to group by.
+        numerators (list, optional): Numerators from `parse_numerator`. Defaults to
+            "event_measure".
+        ethnicity_lookup (bool): Whether ethnicity is looked up from the ethnicity
+            cohort, rather than being in the cohort files.
+        population (str): The population the cohorts are filtered to, by
+            `filter_population`.
+
+    Returns:
+        list: The requirements of the cohort files.
+    """
+    numerators = numerators or [{"event_1": "event_1", "event_2": "event_2"}]
+    events = dict.fromkeys(
+        numerator[event] for numerator in numerators for event in EVENTS
+    )
+    # each event's flag is derived from its date, if the flag wasn't extracted
+    requirements = [[(event, "flag"), (f"{event}_date", "date")] for event in events]
+
+    for breakdown in breakdowns:
+        if breakdown in CODE_BREAKDOWNS:
+            requirements.extend(
+                [(f"{numerator[CODE_BREAKDOWNS[breakdown]]}_code", "any")]
+                for numerator in numerators
+            )
+        elif breakdown == "ethnicity" and ethnicity_lookup:
+            requirements.append([("patient_id", "id")])
+        elif breakdown == "practice":
+            requirements.append([("practice", "number")])
+        elif breakdown in RAW_VARIABLES:
+            requirements.append(
+                [(breakdown, "any"), (RAW_VARIABLES[breakdown], "number")]
+            )
+        else:
+            requirements.append([(breakdown, "any")])
+    if population != "all":
+        requirements.append([("age_years", "number")])
+    return requirements
+
+
+def check_input_files(
+    input_dir,
+    breakdowns,
+    numerators=None,
+    ethnicity_file=None,
+    shard=None,
+    population="all",
+):
+    """
+    Check the schema of the cohort files, and the ethnicity cohort, without reading
+    their data. See `cohort_requirements` and `input_files` for the arguments.
+
+    Returns:
+        list: A description of each problem with the files.
+    """
+    problems = check_cohort_schemas(
+        input_files(input_dir, shard),
+        cohort_requirements(
+            breakdowns, numerators, ethnicity_file is not None, population
+        ),
+    )
+    if ethnicity_file is not None:
+        problems += check_cohort_schemas([Path(ethnicity_file)], ETHNICITY_REQUIREMENTS)
+    return problems
+
+
+def read_input_files(
+    input_dir,
+    ethnicity_lookup=None,
+    bands=None,
+    numerators=None,
+    shard=None,
+    operator="AND",
+    population="all",
+):
+    """
+    Read the cohort files in a directory.
+
+    Args:
+        input_dir (str): The directory containing the cohort files.
+        ethnicity_lookup (tuple, optional): A lookup from `read_ethnicity_lookup`,
+            for cohorts that haven't been joined with the ethnicity cohort.
+        bands (dict, optional): The age and IMD bands, as keyword arguments to
+            `add_bands`. Defaults to the standard bands, or the children's bands
+            for cohorts extracted for children.
+        numerators (list, optional): Numerators from `parse_numerator` to flag, for
+            cohorts extracted with more than one pair of codelists. Defaults to
+            "event_measure".
+        shard (tuple, optional): Only read the files of a shard from `parse_shard`.
+        operator (str): One of `OPERATORS`, to combine the events into
+            "event_measure" if there aren't any numerators.
+        population (str): One of `POPULATIONS`, to select from cohorts extracted
+            for all patients.
+
+    Yields:
+        tuple: The date of each cohort file and its filtered DataFrame.
+    """
+    for file, df in read_cohorts(input_files(input_dir, shard)):
+        date = get_date_input_file(file.name)
+        # the population is selected first, so the rest is only done for its patients
+        df = filter_population(df, population)
+        if ethnicity_lookup is not None:
+            df["ethnicity"] = lookup_patients(df["patient_id"], ethnicity_lookup)
+        if numerators:
+            df = add_numerator_flags(df, numerators)
+        else:
+            df = derive_event_flags(df, operator)
+        df = (
+            df.pipe(add_bands, **(bands or {}))
+            .pipe(filter_data, FILTERS)
+            .assign(date=date)
+        )
+        yield date, df
+
+
+def calculate_measures(cohorts, breakdowns, denominators=None):
+    """
+    Calculate the total and group counts for each cohort.
+
+    Args:
+        cohorts (iterable): Tuples of the date of each cohort and its DataFrame.
+        breakdowns (list): The names of the columns to group by.
+        denominators (DenominatorCache, optional): A cache of the population counts
+            of the breakdowns other than the code breakdowns. See `aggregate_groups`.
+
+    Returns:
+        pd.DataFrame: The (unredacted) counts, sorted by group, group value and date.
+    """
     measure_df = pd.DataFrame(
         columns=["date", "event_measure", "population", "group", "group_value"]
     )
 
-    for file in Path(args.input_dir).iterdir():
-        if match_input_files(file.name):
-            filters = {
-                "sex": ["M", "F"],
-                "age_band": [
-                    "0-5",
-                    "6-10",
-                    "11-17",
-                    "18-29",
-                    "30-39",
-                    "40-49",
-                    "50-59",
-                    "60-69",
-                    "70-79",
-                    "80+",
-                ],
-            }
-            date = get_date_input_file(file.name)
-            file_path = str(file.absolute())
-            df = pd.read_feather(file_path).pipe(filter_data, filters).assign(date=date)
+    practice_counts = {}
+    for date, df in cohorts:
+        total_count = calculate_total_counts(
+            df, date, group="total", group_value="total"
+        )
 
-            total_count = calculate_total_counts(
-                df, date, group="total", group_value="total"
+        measure_df = pd.concat([measure_df, total_count], ignore_index=True)
+
+        for breakdown in breakdowns:
+            # there are far more practices than values of any other breakdown, so
+            # they're counted into a matrix and added to the table once
+            if breakdown == "practice":
+                practice_counts[date] = calculate_practice_counts(df)
+                continue
+
+            counts = calculate_group_counts(
+                df,
+                breakdown,
+                date,
+                # the code breakdowns' values depend on the codelists
+                None if breakdown in CODE_BREAKDOWNS else denominators,
             )
 
-            measure_df = pd.concat([measure_df, total_count], ignore_index=True)
+            measure_df = pd.concat([measure_df, counts], ignore_index=True)
 
-            for breakdown in breakdowns:
-                counts = calculate_group_counts(df, breakdown, date)
-
-                measure_df = pd.concat([measure_df, counts], ignore_index=True)
+    if practice_counts:
+        measure_df = pd.concat(
+            [measure_df, practice_rows(*practice_matrix(practice_counts))],
+            ignore_index=True,
+        )
 
     # sort by date
 
-    measure_df = measure_df.sort_values(by=["group", "group_value", "date"])
+    return measure_df.sort_values(by=["group", "group_value", "date"])
+
+
+def numerator_groupings(breakdowns, numerators):
+    """
+    The columns to group by for each breakdown of each numerator. The code breakdowns
+    are grouped by the code columns of each numerator's own events, and the other
+    breakdowns are shared by all of the numerators.
+
+    Returns:
+        dict: For each column, the numerators and the breakdown it's grouped by for.
+    """
+    groupings = {}
+    for breakdown in breakdowns:
+        for numerator in numerators:
+            column = breakdown
+            if breakdown in CODE_BREAKDOWNS:
+                column = f"{numerator[CODE_BREAKDOWNS[breakdown]]}_code"
+            groupings.setdefault(column, []).append((numerator, breakdown))
+    return groupings
+
+
+def calculate_numerator_measures(cohorts, breakdowns, numerators, denominators=None):
+    """
+    Calculate the total and group counts of several numerators, which share the
+    denominator, in one pass over the cohorts. Each breakdown is grouped once for
+    all of the numerators it's shared by.
+
+    Args:
+        cohorts (iterable): Tuples of the date of each cohort and its DataFrame, from
+            `read_input_files` with the same numerators.
+        breakdowns (list): The names of the columns to group by.
+        numerators (list): Numerators from `parse_numerator`.
+        denominators (DenominatorCache, optional): A cache of the population counts
+            of the breakdowns other than the code breakdowns. See `aggregate_groups`.
+
+    Returns:
+        dict: The (unredacted) counts of each numerator, keyed by its name, as
+            `calculate_measures` returns them.
+    """
+    columns = ["date", "event_measure", "population", "group", "group_value"]
+    groupings = numerator_groupings(breakdowns, numerators)
+    counts = {numerator["name"]: [] for numerator in numerators}
+
+    for date, df in cohorts:
+        flags = [numerator_column(numerator) for numerator in numerators]
+        totals = df[flags].agg(["sum", "count"])
+        for numerator, flag in zip(numerators, flags):
+            counts[numerator["name"]].append(
+                pd.DataFrame.from_records(
+                    [
+                        {
+                            "date": date,
+                            "event_measure": totals.loc["sum", flag],
+                            "population": totals.loc["count", flag],
+                            "group": "total",
+                            "group_value": "total",
+                        }
+                    ]
+                )
+            )
+
+        for column, uses in groupings.items():
+            flags = list(dict.fromkeys(numerator_column(n) for n, _ in uses))
+            code_column = any(breakdown in CODE_BREAKDOWNS for _, breakdown in uses)
+            grouped = aggregate_groups(
+                df, column, flags, date, None if code_column else denominators
+            )
+            for numerator, breakdown in uses:
+                group_counts = (
+                    grouped[numerator_column(numerator)]
+                    .reset_index()
+                    .rename(
+                        columns={
+                            column: "group_value",
+                            "sum": "event_measure",
+                            "count": "population",
+                        }
+                    )
+                )
+                group_counts["date"] = date
+                group_counts["group"] = breakdown
+                counts[numerator["name"]].append(group_counts[columns])
+
+    return {
+        name: pd.concat(
+            [pd.DataFrame(columns=columns), *frames], ignore_index=True
+        ).sort_values(by=["group", "group_value", "date"])
+        for name, frames in counts.items()
+    }
+
+
+def write_measures(measure_df, output_dir, practice_csv=True):
+    """
+    Redact the counts and write the measure files.
 
+    Args:
+        measure_df (pd.DataFrame): The counts from `calculate_measures`.
+        output_dir (str): The directory to write the measure files to.
+        practice_csv (bool): Whether to write the practice rates to CSV and to the
+            measure store. If not, they're left out of measure_all.csv,
+            measure_practice_rate_deciles.csv isn't written, and only their
+            percentiles are stored.
+
+    Returns:
+        pd.DataFrame: The redacted measure table.
+    """
     measure_df = calculate_and_redact_values(measure_df)
-    measure_df.to_csv(f"{args.input_dir}/measure_all.csv", index=False)
-    measure_for_deciles = measure_df.loc[measure_df["group"] == "practice", :]
-    measure_for_deciles.to_csv(
-        f"{args.input_dir}/measure_practice_rate_deciles.csv", index=False
+    write_measure_store(
+        measure_df, f"{output_dir}/measure_store", practice_rates=practice_csv
+    )
+
+    is_practice = measure_df["group"] == "practice"
+    if practice_csv:
+        measure_df.to_csv(f"{output_dir}/measure_all.csv", index=False)
+        measure_df.loc[is_practice, :].to_csv(
+            f"{output_dir}/measure_practice_rate_deciles.csv", index=False
+        )
+    else:
+        measure_df.loc[~is_practice, :].to_csv(
+            f"{output_dir}/measure_all.csv", index=False
+        )
+    return measure_df
+
+
+def write_partial(partial, path):
+    """
+    Write the unredacted counts of some of the cohorts, such as those of a shard, to
+    be merged with the counts of the other cohorts by `merge_partials`. The counts
+    of each group are written to a Parquet file, so the types of the group values
+    are kept, and the cohorts and shards they're from to partial.json.
+
+    Args:
+        partial (dict): The "counts", as `calculate_measures` returns them, the
+            "sources" (the names of the cohort files counted), the "shards" and the
+            "shard_count".
+        path (Path): The directory to write the partial to.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    counts = partial["counts"]
+    index = {key: partial[key] for key in ["sources", "shards", "shard_count"]}
+    index["groups"] = {}
+    for group in counts["group"].unique():
+        table = pa.Table.from_pandas(
+            counts.loc[counts["group"] == group, :], preserve_index=False
+        )
+        file_name = f"{group}.parquet"
+        replace_file(path / file_name, lambda f: pq.write_table(table, f))
+        index["groups"][group] = file_name
+
+    replace_file(path / "partial.json", lambda f: f.write(json.dumps(index).encode()))
+
+
+def read_partial(path):
+    """Read a partial written by `write_partial`."""
+    path = Path(path)
+    with open(path / "partial.json") as f:
+        partial = json.load(f)
+    columns = ["date", "event_measure", "population", "group", "group_value"]
+    partial["counts"] = pd.concat(
+        [pd.DataFrame(columns=columns)]
+        + [
+            pd.read_parquet(path / file_name)
+            for file_name in partial.pop("groups").values()
+        ],
+        ignore_index=True,
+    )
+    return partial
+
+
+def merge_partials(partials):
+    """
+    Merge partials by adding the counts of each group value on each date. The merge
+    is associative and commutative, so partials can be merged in any order or
+    grouping, and a merged partial can itself be merged.
+
+    Args:
+        partials (list): Partials, as `write_partial` takes them.
+
+    Returns:
+        dict: The merged partial.
+
+    Raises:
+        ValueError: If the partials are of different numbers of shards, or any
+            cohort is in more than one of them, so would be counted twice.
+    """
+    shard_counts = {partial["shard_count"] for partial in partials}
+    if len(shard_counts) != 1:
+        raise ValueError("The partials are of different numbers of shards")
+
+    sources = [source for partial in partials for source in partial["sources"]]
+    repeated = sorted({source for source in sources if sources.count(source) > 1})
+    if repeated:
+        raise ValueError(f"Cohorts are in more than one partial: {repeated}")
+
+    columns = ["date", "event_measure", "population", "group", "group_value"]
+    keys = ["group", "group_value", "date"]
+    counts = (
+        pd.concat([partial["counts"] for partial in partials], ignore_index=True)
+        .groupby(keys, dropna=False, sort=False)[["event_measure", "population"]]
+        .sum()
+        .reset_index()
+    )
+    return {
+        # built as `calculate_measures` builds it, so it's redacted the same way
+        "counts": pd.concat(
+            [pd.DataFrame(columns=columns), counts[columns]], ignore_index=True
+        ).sort_values(by=keys),
+        "sources": sorted(sources),
+        "shards": sorted(shard for partial in partials for shard in partial["shards"]),
+        "shard_count": shard_counts.pop(),
+    }
+
+
+def partial_path(output_dir, shard):
+    """The directory a shard's partial is written to."""
+    index, count = shard
+    return Path(output_dir) / f"partial_{index}_of_{count}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--breakdowns", action="append", default=[], required=False)
+    parser.add_argument("--input-dir", type=str, required=True)
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        help="Directory to write the measure files to. Defaults to the input directory",
+    )
+    parser.add_argument(
+        "--ethnicity-file",
+        type=str,
+        help="Ethnicity cohort to join onto cohorts that haven't already been joined",
+    )
+    parser.add_argument(
+        "--age-edges",
+        type=lambda edges: [int(edge) for edge in edges.split(",")],
+        help=(
+            "Comma separated edges of the age bands, e.g. 0,18,65,120. Defaults to "
+            "the bands of the cohorts' population: 0-5, 6-10 and 11-17 for children"
+        ),
+    )
+    parser.add_argument(
+        "--imd-bands",
+        type=int,
+        help="Number of equal IMD bands, e.g. 10 for deciles. Defaults to quintiles",
+    )
+    parser.add_argument(
+        "--no-practice-csv",
+        dest="practice_csv",
+        action="store_false",
+        help=(
+            "Don't write the practice rates to measure_all.csv, "
+            "measure_practice_rate_deciles.csv or the measure store. Only their "
+            "percentiles are stored, for the deciles charts"
+        ),
+    )
+    parser.add_argument(
+        "--numerator",
+        dest="numerators",
+        action="append",
+        type=parse_numerator,
+        default=[],
+        help=(
+            "A numerator to calculate, as name:event_1:event_2[:operator], for cohorts "
+            "extracted with more than one pair of codelists. Can be given more than "
+            "once; each numerator's measures are written to a directory of its name "
+            "in the output directory"
+        ),
+    )
+    parser.add_argument(
+        "--operator",
+        dest="operators",
+        action="append",
+        type=parse_operator,
+        choices=list(OPERATORS),
+        default=[],
+        help=(
+            "How the events are combined into the measure. Defaults to AND. Can be "
+            "given more than once; each operator's measures are then written to a "
+            "directory of its name, e.g. and_not, in the output directory"
+        ),
     )
+    parser.add_argument(
+        "--population",
+        choices=POPULATIONS,
+        default="all",
+        help=(
+            "The population to calculate the measures for, selected by age from "
+            "cohorts extracted for all patients. Defaults to all"
+        ),
+    )
+    parser.add_argument(
+        "--denominator-cache",
+        type=Path,
+        help=(
+            "A directory to cache the population counts of each breakdown in, "
+            "shared with the other studies of the population"
+        ),
+    )
+    parser.add_argument(
+        "--denominator-cache-max-age",
+        type=float,
+        default=30,
+        help="Days after which cached population counts are recounted",
+    )
+    parser.add_argument(
+        "--denominator-cache-max-size",
+        type=float,
+        default=100,
+        help="Megabytes the denominator cache is reduced to after each run",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help=(
+            "Only count the cohorts of one shard, as i/N for the ith of N shards, "
+            "and write their unredacted counts to a partial_i_of_N directory, to be "
+            "merged with measures_merge.py"
+        ),
+    )
+    args = parser.parse_args()
+    if args.operators and args.numerators:
+        parser.error("--operator can't be used with --numerator")
+    return args
+
+
+def main():
+    args = parse_args()
+    breakdowns = args.breakdowns
+
+    breakdowns.extend(["practice", "event_1_code", "event_2_code"])
+
+    numerators = args.numerators
+    operator = "AND"
+    if len(args.operators) > 1:
+        # the measures of every operator are calculated in one pass, as numerators
+        numerators = [operator_numerator(op) for op in dict.fromkeys(args.operators)]
+    elif args.operators:
+        operator = args.operators[0]
+
+    # check the schema of every cohort file before any are read
+    problems = check_input_files(
+        args.input_dir,
+        breakdowns,
+        numerators,
+        args.ethnicity_file,
+        args.shard,
+        args.population,
+    )
+    if problems:
+        sys.exit(
+            "Can't calculate the measures from the cohorts:\n" + "\n".join(problems)
+        )
+
+    output_dir = Path(args.output_dir or args.input_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    ethnicity_lookup = None
+    if args.ethnicity_file:
+        ethnicity_lookup = read_ethnicity_lookup(args.ethnicity_file)
+
+    bands = {}
+    if args.age_edges:
+        bands["age"] = age_bands(args.age_edges)
+    if args.imd_bands:
+        bands["imd"] = imd_bands(args.imd_bands)
+
+    denominators = None
+    if args.denominator_cache:
+        # unless others are given, children's ages are banded with their own bands,
+        # whether they're selected from all patients or their cohorts are extracted
+        # for children
+        if args.population == "children":
+            default_age_bands = CHILDREN_AGE_BANDS
+        else:
+            default_age_bands = {"adults": AGE_BANDS, "children": CHILDREN_AGE_BANDS}
+        population = population_key(
+            population=args.population,
+            filters=FILTERS,
+            bands={
+                "age": bands.get("age", default_age_bands),
+                "imd": bands.get("imd", IMD_QUINTILES),
+            },
+            # the ethnicity cohort by its contents, as studies may look ethnicity
+            # up from different ones
+            ethnicity_file=args.ethnicity_file and file_digest(args.ethnicity_file),
+        )
+        denominators = DenominatorCache(
+            args.denominator_cache,
+            population,
+            max_age=args.denominator_cache_max_age * 24 * 60 * 60,
+            max_bytes=args.denominator_cache_max_size * 10**6,
+        )
+
+    if numerators:
+        measure_dfs = calculate_numerator_measures(
+            read_input_files(
+                args.input_dir,
+                ethnicity_lookup,
+                bands,
+                numerators,
+                args.shard,
+                population=args.population,
+            ),
+            breakdowns,
+            numerators,
+            denominators,
+        )
+    else:
+        measure_dfs = {
+            None: calculate_measures(
+                read_input_files(
+                    args.input_dir,
+                    ethnicity_lookup,
+                    bands,
+                    shard=args.shard,
+                    operator=operator,
+                    population=args.population,
+                ),
+                breakdowns,
+                denominators,
+            )
+        }
+    if denominators is not None:
+        denominators.evict()
+
+    for name, measure_df in measure_dfs.items():
+        # each numerator's (or operator's) measures are written to a directory of
+        # its name
+        measure_dir = output_dir if name is None else output_dir / name
+        measure_dir.mkdir(exist_ok=True)
+        if args.shard is None:
+            write_measures(measure_df, measure_dir, args.practice_csv)
+            continue
+
+        partial = {
+            "counts": measure_df,
+            "sources": [file.name for file in input_files(args.input_dir, args.shard)],
+            "shards": [args.shard[0]],
+            "shard_count": args.shard[1],
+        }
+        write_partial(partial, partial_path(measure_dir, args.shard))
 
 
 if __name__ == "__main__":
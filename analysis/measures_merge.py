@@ -0,0 +1,71 @@
+import argparse
+import sys
+from pathlib import Path
+
+from analysis.measures import (
+    merge_partials,
+    read_partial,
+    write_measures,
+    write_partial,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Merge the partial counts written by measures.py --shard, and write the "
+            "redacted measures once every shard has been merged"
+        )
+    )
+    parser.add_argument(
+        "--partials",
+        type=Path,
+        nargs="+",
+        required=True,
+        help="The partial directories to merge, e.g. output/partial_*_of_4",
+    )
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument(
+        "--partial",
+        action="store_true",
+        help=(
+            "Write the merged counts as a partial to the output directory, to be "
+            "merged again, rather than writing the measures"
+        ),
+    )
+    parser.add_argument(
+        "--no-practice-csv",
+        dest="practice_csv",
+        action="store_false",
+        help="See measures.py --no-practice-csv",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        partial = merge_partials([read_partial(path) for path in args.partials])
+    except ValueError as e:
+        sys.exit(f"Can't merge the partials: {e}")
+
+    if args.partial:
+        write_partial(partial, args.output_dir)
+        return
+
+    # the counts are only redacted when they're complete, as the redaction of the
+    # merged counts isn't the merge of the redacted partial counts
+    missing = sorted(set(range(1, partial["shard_count"] + 1)) - set(partial["shards"]))
+    if missing:
+        sys.exit(
+            f"Can't write the measures without shards {missing} "
+            f"of {partial['shard_count']}"
+        )
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    write_measures(partial["counts"], args.output_dir, args.practice_csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+from analysis.banding import age_bands, imd_bands
+from analysis.cohort_utils import read_ethnicity_lookup
+from analysis.event_counts import check_input_files as check_event_count_files
+from analysis.event_counts import get_event_counts
+from analysis.event_flags import OPERATORS, parse_operator
+from analysis.measure_store import MeasureStore
+from analysis.measures import (
+    calculate_measures,
+    check_input_files,
+    read_input_files,
+    write_measures,
+)
+from analysis.plot_measures import plot_all_measures
+from analysis.render_report import get_parser as get_report_parser
+from analysis.render_report import render
+from analysis.report_utils import save_to_json
+from analysis.top_5 import write_top_5_tables
+
+
+def run_pipeline(
+    input_dir,
+    output_dir,
+    codelist_1_path,
+    codelist_2_path,
+    breakdowns=(),
+    ethnicity_file=None,
+    daily_counts=None,
+    bands=None,
+    workers=None,
+    operator="AND",
+    population="all",
+    **report_params,
+):
+    """
+    Run the measures, top 5, plot, event count and report stages in one process.
+
+    The stages pass their results to each other as DataFrames, rather than reading
+    them back from the files they write, but every file the separate actions write
+    is still written. Stages that don't depend on each other run concurrently.
+
+    Args:
+        input_dir (str): The directory containing the cohort files.
+        output_dir (str): The output directory the report is written to.
+        codelist_1_path (str): Path to codelist 1.
+        codelist_2_path (str): Path to codelist 2.
+        breakdowns (list): The demographic breakdowns.
+        ethnicity_file (str, optional): See `measures.py --ethnicity-file`.
+        daily_counts (str, optional): See `event_counts.py --daily-counts`.
+        bands (dict, optional): See `measures.read_input_files`.
+        workers (int, optional): The number of stages to run concurrently.
+        operator (str): One of `OPERATORS`, to combine the events into the measure.
+        population (str): One of `POPULATIONS`, to select from the cohorts. Also
+            passed to `render_report.render`, as `--population` is its argument.
+        **report_params: Passed to `render_report.render`.
+
+    Returns:
+        Path: The path to the report.
+    """
+    breakdowns = list(breakdowns)
+    measure_breakdowns = [*breakdowns, "practice", "event_1_code", "event_2_code"]
+    problems = check_input_files(
+        input_dir,
+        measure_breakdowns,
+        ethnicity_file=ethnicity_file,
+        population=population,
+    ) + check_event_count_files(input_dir, daily_counts is not None, population)
+    if problems:
+        raise ValueError(
+            "Can't run the pipeline on the cohorts:\n" + "\n".join(problems)
+        )
+
+    output_dir = Path(output_dir)
+    (output_dir / "joined").mkdir(parents=True, exist_ok=True)
+    image_format = report_params.get("image_format", "png")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # event counts only need the cohorts, so are counted alongside the measures
+        event_counts = executor.submit(
+            get_event_counts, input_dir, daily_counts, operator, population
+        )
+
+        ethnicity_lookup = None
+        if ethnicity_file:
+            ethnicity_lookup = read_ethnicity_lookup(ethnicity_file)
+        measure_df = calculate_measures(
+            read_input_files(
+                input_dir,
+                ethnicity_lookup,
+                bands,
+                operator=operator,
+                population=population,
+            ),
+            measure_breakdowns,
+        )
+        measure_df = write_measures(measure_df, output_dir / "joined")
+        measure_df["date"] = pd.to_datetime(measure_df["date"])
+
+        top_5_tables = executor.submit(
+            write_top_5_tables,
+            measure_df,
+            codelist_1_path,
+            codelist_2_path,
+            output_dir,
+        )
+        # pyplot isn't thread-safe, so all the charts are plotted in one stage
+        plots = executor.submit(
+            plot_all_measures,
+            MeasureStore(output_dir / "joined/measure_store"),
+            breakdowns,
+            output_dir,
+            "svg" if image_format == "svg" else "png",
+        )
+
+        event_counts = event_counts.result()
+        save_to_json(event_counts, f"{output_dir}/event_counts.json")
+        top_5_tables = top_5_tables.result()
+        plots.result()
+
+    return render(
+        output_dir,
+        breakdowns=breakdowns,
+        measure_df=measure_df,
+        top_5_tables=top_5_tables,
+        event_counts=event_counts,
+        population=population,
+        **report_params,
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run the measures, top 5, plot, event count and report actions in one "
+            "process. Arguments not listed here are parsed as render_report.py "
+            "arguments."
+        )
+    )
+    parser.add_argument("--input-dir", type=str, required=True)
+    parser.add_argument("--codelist-1-path", type=str, required=True)
+    parser.add_argument("--codelist-2-path", type=str, required=True)
+    parser.add_argument("--ethnicity-file", type=str)
+    parser.add_argument("--daily-counts", type=str)
+    parser.add_argument(
+        "--age-edges",
+        type=lambda edges: [int(edge) for edge in edges.split(",")],
+    )
+    parser.add_argument("--imd-bands", type=int)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--operator", type=parse_operator, choices=list(OPERATORS), default="AND"
+    )
+    args, report_args = parser.parse_known_args()
+
+    report_params = vars(get_report_parser().parse_args(report_args))
+    return args, report_params
+
+
+def main():
+    args, report_params = parse_args()
+
+    bands = {}
+    if args.age_edges:
+        bands["age"] = age_bands(args.age_edges)
+    if args.imd_bands:
+        bands["imd"] = imd_bands(args.imd_bands)
+
+    run_pipeline(
+        args.input_dir,
+        codelist_1_path=args.codelist_1_path,
+        codelist_2_path=args.codelist_2_path,
+        ethnicity_file=args.ethnicity_file,
+        daily_counts=args.daily_counts,
+        bands=bands,
+        workers=args.workers,
+        operator=args.operator,
+        **report_params,
+    )
+
+
+if __name__ == "__main__":
+    main()
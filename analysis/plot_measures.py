@@ -1,7 +1,11 @@
 import argparse
 
-import pandas as pd
-from report_utils import deciles_chart, plot_measures
+import numpy as np
+from analysis.measure_store import MeasureStore
+from analysis.report_utils import compute_matrix_deciles, plot_deciles, plot_lines
+
+
+IMD_ORDER = ["Most deprived", "2", "3", "4", "Least deprived"]
 
 
 def parse_args():
@@ -10,68 +14,95 @@ def parse_args():
         "--breakdowns", action="append", default=[], help="breakdowns to use"
     )
     parser.add_argument("--output-dir", help="output directory", required=True)
+    parser.add_argument(
+        "--image-format",
+        choices=["png", "svg"],
+        default="png",
+        help="file format for the charts",
+    )
     args = parser.parse_args()
     return args
 
 
-def main():
-    args = parse_args()
-    breakdowns = args.breakdowns
+def plot_group(store, group, filename, category_order=None, image_format="png"):
+    """
+    Plot the rates of a group from the measure store, with one line for each of its
+    values. Redacted rates are left out of the lines.
+
+    Args:
+        store: The `MeasureStore`.
+        group: The group to plot.
+        filename: Path to save the chart to, without the extension.
+        category_order: The values to plot, in order. Defaults to the values with
+            any rates that aren't redacted, in the order of the store.
+        image_format: The file format of the chart, "png" or "svg".
+    """
+    rates = store.matrix(group)
+    values = ["Missing" if value is None else value for value in store.values(group)]
+    plotted = [value for value, row in zip(values, rates) if not np.isnan(row).all()]
+
+    lines = []
+    for value in category_order or plotted:
+        row = rates[values.index(value)] if value in values else np.array([])
+        shown = ~np.isnan(row)
+        lines.append((store.periods[shown], row[shown]))
 
-    df = pd.read_csv(
-        f"{ args.output_dir }/joined/measure_all.csv", parse_dates=["date"]
+    plot_lines(
+        lines,
+        filename,
+        y_label="Rate per 1000",
+        y_max=None if np.isnan(rates).all() else np.nanmax(rates),
+        legend=category_order or sorted(plotted),
+        image_format=image_format,
     )
-    df = df.loc[df["value"] != "[Redacted]", :]
-    df["value"] = df["value"].astype(float)
-
-    df_total = df.loc[df["group"] == "total", :]
-    plot_measures(
-        df_total,
-        filename=f"{ args.output_dir }/plot_measures",
-        column_to_plot="value",
+
+
+def plot_all_measures(store, breakdowns, output_dir, image_format="png"):
+    """
+    Plot the total and breakdown measures, and the practice deciles chart.
+
+    Args:
+        store: The `MeasureStore` written by `measures.py`.
+        breakdowns: The breakdowns to plot.
+        output_dir: The directory to write the charts to.
+        image_format: The file format of the charts, "png" or "svg".
+    """
+    total = store.series("total", "total")
+    shown = ~np.isnan(total)
+    plot_lines(
+        [(store.periods[shown], total[shown])],
+        f"{ output_dir }/plot_measures",
         y_label="Rate per 1000",
-        category=None,
+        y_max=None if not shown.any() else total[shown].max(),
+        image_format=image_format,
     )
 
     for breakdown in breakdowns:
-        df_subset = df.loc[df["group"] == breakdown, :]
-
-        if breakdown == "imd":
-            plot_measures(
-                df_subset,
-                filename=f"{ args.output_dir }/plot_measures_{breakdown}",
-                column_to_plot="value",
-                y_label="Rate per 1000",
-                category="group_value",
-                category_order=[
-                    "Most deprived",
-                    "2",
-                    "3",
-                    "4",
-                    "Least deprived",
-                ],
-            )
-        else:
-            plot_measures(
-                df_subset,
-                filename=f"{ args.output_dir }/plot_measures_{breakdown}",
-                column_to_plot="value",
-                y_label="Rate per 1000",
-                category="group_value",
-            )
-
-    practice_df = pd.read_csv(
-        f"{ args.output_dir }/joined/measure_practice_rate_deciles.csv",
-        parse_dates=["date"],
-    )
-    deciles_chart(
-        practice_df,
-        f"{ args.output_dir }/deciles_chart.png",
+        plot_group(
+            store,
+            breakdown,
+            f"{ output_dir }/plot_measures_{breakdown}",
+            category_order=IMD_ORDER if breakdown == "imd" else None,
+            image_format=image_format,
+        )
+
+    # the percentiles are computed from the store, so don't need the practice rates
+    # to have been written to CSV
+    plot_deciles(
+        compute_matrix_deciles(store, "date"),
+        f"{ output_dir }/deciles_chart.{ image_format }",
         period_column="date",
         column="value",
         ylabel="rate per 1000",
     )
 
 
+def main():
+    args = parse_args()
+
+    store = MeasureStore(f"{ args.output_dir }/joined/measure_store")
+    plot_all_measures(store, args.breakdowns, args.output_dir, args.image_format)
+
+
 if __name__ == "__main__":
     main()
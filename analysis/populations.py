@@ -1,6 +1,9 @@
 from cohortextractor import patients
 
 
+# The adults and children differ from all patients only by age, so they can also
+# be selected from the cohorts of "all" with `banding.filter_population`, by the
+# `--population` of measures.py and event_counts.py, without extracting them again.
 population_filters = {
     "adults": (
         patients.satisfying(
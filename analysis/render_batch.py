@@ -0,0 +1,134 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from analysis.render_report import get_parser as get_report_parser
+from analysis.render_report import get_renderer
+
+
+def expand_output_dirs(patterns):
+    """
+    Expand output directories given as paths or glob patterns
+    Args:
+        patterns (list): paths or glob patterns, e.g. "output/*"
+    Returns:
+        sorted list of the matching directories
+    """
+    output_dirs = set()
+    for pattern in patterns:
+        output_dirs.update(Path(p) for p in glob.glob(pattern) if Path(p).is_dir())
+    return sorted(output_dirs)
+
+
+def get_jobs(output_dirs, params, shared_params):
+    """
+    Get the parameters to render each report with
+    Args:
+        output_dirs (list): paths or glob patterns of output directories
+        params (dict): maps output directories (or glob patterns) to the
+            parameters of their reports, as keyword arguments to `render`
+        shared_params (dict): parameters for every report, overridden by `params`
+    Returns:
+        dict mapping each output directory to the parameters of its report
+    """
+    jobs = {
+        output_dir: dict(shared_params)
+        for output_dir in expand_output_dirs(output_dirs)
+    }
+    for pattern, report_params in params.items():
+        for output_dir in expand_output_dirs([pattern]):
+            jobs[output_dir] = {**shared_params, **report_params}
+    return jobs
+
+
+def render_one(renderer, output_dir, report_params):
+    """
+    Render one report, returning the error rather than raising it so that one
+    failed report doesn't stop the rest of the batch
+    """
+    try:
+        renderer.render(output_dir, **report_params)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def render_batch(jobs, template_cache_dir=None, workers=None):
+    """
+    Render many reports from one process. All reports share the same renderer,
+    so the templates are compiled at most once.
+    Args:
+        jobs (dict): maps output directories to the parameters of their reports
+        template_cache_dir (str): directory for compiled templates
+        workers (int): number of reports to render concurrently
+    Returns:
+        dict mapping the output directory of each failed report to its error
+    """
+    renderer = get_renderer(template_cache_dir)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = executor.map(
+            lambda job: render_one(renderer, *job),
+            jobs.items(),
+        )
+        return {
+            output_dir: error
+            for output_dir, error in zip(jobs.keys(), errors)
+            if error is not None
+        }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Render reports for many output directories. Arguments not listed here "
+            "are parsed as render_report.py arguments and apply to every report."
+        )
+    )
+    parser.add_argument(
+        "output_dirs",
+        nargs="*",
+        help="output directories, or glob patterns such as 'output/*'",
+    )
+    parser.add_argument(
+        "--params-file",
+        type=Path,
+        help=(
+            "JSON file mapping output directories (or glob patterns) to the "
+            "parameters of their reports, e.g. "
+            '{"output/01GZ17N26M1KMZ5R42MCEDK1R4": {"breakdowns": ["sex"]}}'
+        ),
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args, report_args = parser.parse_known_args()
+
+    shared_params = vars(get_report_parser().parse_args(report_args))
+    shared_params.pop("output_dir")
+    return args, shared_params
+
+
+def main():
+    args, shared_params = parse_args()
+    template_cache_dir = shared_params.pop("template_cache_dir")
+
+    params = {}
+    if args.params_file:
+        params = json.loads(args.params_file.read_text())
+
+    jobs = get_jobs(args.output_dirs, params, shared_params)
+    errors = render_batch(jobs, template_cache_dir, workers=args.workers)
+
+    for output_dir, error in errors.items():
+        print(f"Failed to render report for {output_dir}:\n{error}", file=sys.stderr)
+    print(f"Rendered {len(jobs) - len(errors)} of {len(jobs)} reports")
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
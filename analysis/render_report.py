@@ -1,31 +1,318 @@
 import argparse
 import csv
+import functools
+import hashlib
+import io
 import json
 import mimetypes
 from base64 import b64encode
 from pathlib import Path
 
-from jinja2 import Environment, FileSystemLoader, Markup, StrictUndefined
+import numpy as np
+import pandas as pd
+from analysis.measure_store import PERCENTILES, MeasureStore
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Markup,
+    StrictUndefined,
+)
+from PIL import Image
 
 
-ENVIRONMENT = Environment(
-    loader=FileSystemLoader("."),
-    undefined=StrictUndefined,
-)
+TEMPLATE_DIR = Path(__file__).parent
+TEMPLATE_NAME = "report_template.html"
 
+IMAGE_MODES = ["inline", "external"]
+IMAGE_FORMATS = ["png", "webp", "svg"]
+REPORT_MODES = ["static", "interactive"]
 
-def display_image(src, data):
-    src = Path(src)
+CATEGORY_ORDER = {
+    "imd": ["Most deprived", "2", "3", "4", "Least deprived"],
+}
 
-    encoded = b64encode(src.read_bytes()).decode("utf8")
+
+def optimise_image(src, image_format="png", quantise=False):
+    """
+    Re-encode an image for embedding in, or linking from, the report
+    Args:
+        src (Path): path to the source image
+        image_format (str): "png" or "webp". SVG sources are returned unchanged.
+        quantise (bool): whether to palette-quantise png output. This is lossy, so
+            is only used for external assets.
+    Returns:
+        tuple of the encoded bytes and the mimetype
+    """
+    original = src.read_bytes()
+    if src.suffix == ".svg":
+        return original, "image/svg+xml"
+
+    image = Image.open(io.BytesIO(original))
+    buffer = io.BytesIO()
+    if image_format == "webp":
+        image.save(buffer, format="WEBP", lossless=True, method=6)
+        return buffer.getvalue(), "image/webp"
+
+    if quantise:
+        image = image.convert("RGB").quantize(colors=256)
+    elif image.mode == "RGBA" and image.getchannel("A").getextrema() == (255, 255):
+        # matplotlib writes an alpha channel even when every pixel is opaque
+        image = image.convert("RGB")
+    image.save(buffer, format="PNG", compress_level=9)
+    encoded = buffer.getvalue()
+
+    # Lossless recompression can't always beat the encoder that wrote the
+    # original, in which case we keep the original.
+    if not quantise and len(encoded) >= len(original):
+        encoded = original
     mtype, _ = mimetypes.guess_type(str(src))
+    return encoded, mtype or "image/png"
+
 
-    return Markup(
-        f'<img src="data:{mtype};base64,{encoded}" title="Image generated from file: {data}">'
+def write_asset(content, extension, assets_dir):
+    """
+    Write an image asset named by the hash of its content, so identical images
+    are only written once
+    Args:
+        content (bytes): the encoded image
+        extension (str): file extension, including the leading dot
+        assets_dir (Path): directory to write the asset to
+    Returns:
+        path to the asset
+    """
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    asset = assets_dir / f"{digest}{extension}"
+    if not asset.exists():
+        assets_dir.mkdir(parents=True, exist_ok=True)
+        asset.write_bytes(content)
+    return asset
+
+
+def display_image(src, data, output_dir=None, image_mode="inline", image_format="png"):
+    """
+    Render an <img> tag for a figure
+    Args:
+        src: path to the image
+        data: path to the data the image was generated from
+        output_dir (Path): the report's output directory. Required for external images.
+        image_mode (str): "inline" embeds the image in the html as base64,
+            "external" writes it to `output_dir/assets` and links to it
+        image_format (str): "png", "webp" or "svg". If "svg" is requested but
+            no svg version of the image exists, the png is used instead.
+    """
+    src = Path(src)
+    if image_format == "svg" and src.with_suffix(".svg").exists():
+        src = src.with_suffix(".svg")
+
+    content, mtype = optimise_image(
+        src, image_format=image_format, quantise=image_mode == "external"
     )
 
+    if image_mode == "external":
+        extension = mimetypes.guess_extension(mtype) or src.suffix
+        asset = write_asset(content, extension, Path(output_dir) / "assets")
+        img_src = asset.relative_to(output_dir).as_posix()
+    else:
+        encoded = b64encode(content).decode("utf8")
+        img_src = f"data:{mtype};base64,{encoded}"
+
+    return Markup(f'<img src="{img_src}" title="Image generated from file: {data}">')
+
+
+def display_chart(figure):
+    """
+    Render a placeholder that the report's script draws the chart for `figure` into
+    Args:
+        figure (dict): a figure from `get_data`
+    """
+    return Markup(f'<div class="chart" data-group="{figure["group"]}"></div>')
 
-ENVIRONMENT.globals["display_image"] = display_image
+
+def encode_dates(dates):
+    """
+    Delta-encode a sorted sequence of distinct dates
+    Args:
+        dates: sorted datetime64 values
+    Returns:
+        dict of the first date and the day differences between consecutive dates
+    """
+    days = dates.values.astype("datetime64[D]").astype(np.int64)
+    return {
+        "start": str(dates[0].date()),
+        "deltas": np.diff(days, prepend=days[0]).tolist(),
+    }
+
+
+def encode_group(group_df, date_index, order=None):
+    """
+    Columnar encoding of the series for one group of the measure table, with the
+    group values dictionary-encoded and dates as indices into the report's dates
+    Args:
+        group_df (pd.DataFrame): rows of the measure table for one group
+        date_index (pd.Index): the distinct dates in the report
+        order (list): the order in which to draw the group values, optional
+    Returns:
+        dict with the distinct group values and one column per field
+    """
+    group_values = group_df["group_value"].fillna("Missing").astype(str)
+    values = sorted(group_values.unique())
+    if order and set(values).issubset(order):
+        values = [v for v in order if v in values]
+    rates = pd.to_numeric(group_df["value"], errors="coerce").round(4)
+
+    return {
+        "values": values,
+        "value": pd.Categorical(group_values, categories=values).codes.tolist(),
+        "date": date_index.get_indexer(group_df["date"]).tolist(),
+        "rate": [rate if np.isfinite(rate) else None for rate in rates],
+    }
+
+
+def encode_deciles(store, date_index):
+    """
+    Compute the percentiles of practice rates for each date, for the deciles chart
+    Args:
+        store (MeasureStore): the measure store, with the practice rates or their
+            percentiles
+        date_index (pd.Index): the distinct dates in the report
+    Returns:
+        dict with the percentiles, and for each percentile its values ordered by date
+    """
+    values = np.full((len(PERCENTILES), len(date_index)), np.nan)
+    columns = date_index.get_indexer(store.periods)
+    in_report = columns >= 0
+    values[:, columns[in_report]] = store.practice_percentiles(PERCENTILES, in_report)
+    values = np.round(values, 4)
+
+    return {
+        "percentiles": PERCENTILES,
+        "values": [[v if np.isfinite(v) else None for v in row] for row in values],
+    }
+
+
+def get_chart_data(output_dir, breakdowns, measure_df=None):
+    """
+    Encode the redacted measure series as compact JSON for the interactive report
+    Args:
+        output_dir (Path): the output directory all the files are in
+        breakdowns (list): list of demographic breakdowns
+        measure_df (pd.DataFrame): the redacted measure table, with dates parsed.
+            Read from measure_all.csv if not given.
+    Returns:
+        JSON string, safe to embed in a <script> element
+    """
+    if measure_df is None:
+        measure_df = pd.read_csv(
+            output_dir / "joined/measure_all.csv", parse_dates=["date"]
+        )
+    measure_df = measure_df.loc[
+        measure_df["group"].isin(["total", "practice", *breakdowns]), :
+    ].sort_values(["group", "group_value", "date"])
+
+    date_index = pd.Index(np.sort(measure_df["date"].unique()))
+    series = {
+        group: encode_group(group_df, date_index, CATEGORY_ORDER.get(group))
+        for group, group_df in measure_df.groupby("group")
+        if group != "practice"
+    }
+    store = MeasureStore(output_dir / "joined/measure_store")
+    series["practice"] = encode_deciles(store, date_index)
+
+    chart_data = {"dates": encode_dates(pd.DatetimeIndex(date_index)), "series": series}
+    encoded = json.dumps(chart_data, separators=(",", ":"))
+    return Markup(encoded.replace("</", "<\\/"))
+
+
+class ReportRenderer:
+    """
+    Renders reports from the templates in `template_dir`.
+
+    Compiled templates are written to a bytecode cache on disk, so only the first
+    process to load a template compiles it. Within a process the compiled template
+    is held in memory, so one renderer can render any number of reports.
+
+    Args:
+        template_dir (Path): directory containing the report templates
+        cache_dir (str): directory for the bytecode cache. Defaults to a
+            per-user directory in the system temp directory.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, cache_dir=None):
+        if cache_dir is not None:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self.environment = Environment(
+            loader=FileSystemLoader(str(template_dir)),
+            undefined=StrictUndefined,
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            auto_reload=False,
+        )
+        self.environment.globals["display_figure"] = self.display_figure
+
+    def get_template(self, template_name=TEMPLATE_NAME):
+        return self.environment.get_template(template_name)
+
+    @staticmethod
+    def display_figure(figure, **kwargs):
+        return display_image(figure["path"], figure["data"], **kwargs)
+
+    def render(
+        self,
+        output_dir,
+        report_mode="static",
+        image_mode="inline",
+        image_format="png",
+        template_name=TEMPLATE_NAME,
+        measure_df=None,
+        **kwargs,
+    ):
+        """
+        Render a report and stream it to `output_dir/report.html`
+        Args:
+            output_dir (Path): the output directory all the files are in
+            report_mode (str): "static" displays the plotted charts. "interactive"
+                embeds the measure data and draws the charts in the browser, so
+                doesn't need plot_measures.py to have been run.
+            image_mode (str): see `display_image`
+            image_format (str): see `display_image`
+            template_name (str): name of the template in the template directory
+            measure_df (pd.DataFrame): see `get_chart_data`
+            **kwargs: passed to `get_data`
+        Returns:
+            path to the report
+        """
+        output_dir = Path(output_dir)
+        report_data = get_data(output_dir=output_dir, **kwargs)
+        template = self.get_template(template_name)
+
+        if report_mode == "interactive":
+            display_figure = display_chart
+            chart_data = get_chart_data(
+                output_dir, kwargs.get("breakdowns", []), measure_df
+            )
+        else:
+            display_figure = functools.partial(
+                self.display_figure,
+                output_dir=output_dir,
+                image_mode=image_mode,
+                image_format=image_format,
+            )
+            chart_data = None
+
+        stream = template.generate(
+            report_data, display_figure=display_figure, chart_data=chart_data
+        )
+
+        report = output_dir / "report.html"
+        with report.open("w") as f:
+            f.writelines(stream)
+        return report
+
+
+@functools.lru_cache(maxsize=None)
+def get_renderer(cache_dir=None):
+    """Get a renderer, shared by all callers in this process that use the same cache"""
+    return ReportRenderer(cache_dir=cache_dir)
 
 
 def data_from_csv(path):
@@ -41,6 +328,17 @@ def data_from_csv(path):
         return [row for row in reader]
 
 
+def data_from_df(df):
+    """
+    Get the data of a table as `data_from_csv` would read it from the table's csv file
+    Args:
+        df: the table
+    Returns:
+        list of lists (rows) containing the data
+    """
+    return [row for row in csv.reader(io.StringIO(df.to_csv(index=False)))]
+
+
 def data_from_json(path):
     """
     Read data from a json file
@@ -67,6 +365,8 @@ def get_data(
     start_date="",
     end_date="",
     time_ever=False,
+    top_5_tables=None,
+    event_counts=None,
 ):
     """
     Get data to render the report
@@ -84,6 +384,10 @@ def get_data(
         start_date (str): start date for the report
         end_date (str): end date for the report
         time_ever (bool): whether codelist 2 uses time ever
+        top_5_tables (list): the top 5 code tables for codelists 1 and 2. Read from
+            their csv files if not given.
+        event_counts (dict): the summary table data. Read from event_counts.json if
+            not given.
     Returns:
         dict containing the data
     """
@@ -96,36 +400,50 @@ def get_data(
     top_5_2_path = output_dir / "joined/top_5_code_table_2.csv"
     summary_table_path = output_dir / "event_counts.json"
 
-    top_5_1_data = data_from_csv(top_5_1_path)
-    top_5_2_data = data_from_csv(top_5_2_path)
-    summary_table_data = data_from_json(summary_table_path)
+    if top_5_tables is None:
+        top_5_1_data = data_from_csv(top_5_1_path)
+        top_5_2_data = data_from_csv(top_5_2_path)
+    else:
+        top_5_1_data, top_5_2_data = map(data_from_df, top_5_tables)
+
+    if event_counts is None:
+        summary_table_data = data_from_json(summary_table_path)
+    else:
+        summary_table_data = event_counts
 
     figures = {
         "decile": {
+            "group": "practice",
             "path": output_dir / "deciles_chart.png",
             "data": output_dir / "joined/measure_practice_rate_deciles.csv",
         },
         "population": {
+            "group": "total",
             "path": output_dir / "plot_measures.png",
             "data": output_dir / "joined/measure_total_rate.csv",
         },
         "sex": {
+            "group": "sex",
             "path": output_dir / "plot_measures_sex.png",
             "data": output_dir / "joined/measure_sex_rate.csv",
         },
         "age": {
+            "group": "age",
             "path": output_dir / "plot_measures_age.png",
             "data": output_dir / "joined/measure_age_rate.csv",
         },
         "imd": {
+            "group": "imd",
             "path": output_dir / "plot_measures_imd.png",
             "data": output_dir / "joined/measure_imd_rate.csv",
         },
         "region": {
+            "group": "region",
             "path": output_dir / "plot_measures_region.png",
             "data": output_dir / "joined/measure_region_rate.csv",
         },
         "ethnicity": {
+            "group": "ethnicity",
             "path": output_dir / "plot_measures_ethnicity.png",
             "data": output_dir / "joined/measure_ethnicity_rate.csv",
         },
@@ -214,7 +532,7 @@ def render_report(report_path, data):
         data: data to render
 
     """
-    template = ENVIRONMENT.get_template("analysis/report_template.html")
+    template = get_renderer().get_template()
     return template.render(data)
 
 
@@ -229,11 +547,8 @@ def write_html(html, output_dir):
         f.write(html)
 
 
-def render(output_dir, **kwargs):
-    report_data = get_data(output_dir=output_dir, **kwargs)
-    template = ENVIRONMENT.get_template("analysis/report_template.html")
-    report = args.output_dir / "report.html"
-    report.write_text(template.render(report_data))
+def render(output_dir, template_cache_dir=None, **kwargs):
+    return get_renderer(template_cache_dir).render(output_dir, **kwargs)
 
 
 def get_parser():
@@ -250,7 +565,26 @@ def get_parser():
     parser.add_argument("--time-value", type=str, default="")
     parser.add_argument("--time-scale", type=str, default="")
     parser.add_argument("--time-event", type=str, default="")
-    parser.add_argument("--time-ever", type=bool, default=False)
+    parser.add_argument("--time-ever", action="store_true")
+    parser.add_argument(
+        "--image-mode",
+        choices=IMAGE_MODES,
+        default="inline",
+        help="Embed images in report.html, or write them alongside it in assets/",
+    )
+    parser.add_argument("--image-format", choices=IMAGE_FORMATS, default="png")
+    parser.add_argument(
+        "--report-mode",
+        choices=REPORT_MODES,
+        default="static",
+        help="Display plotted charts, or draw them in the browser from embedded data",
+    )
+    parser.add_argument(
+        "--template-cache-dir",
+        type=str,
+        default=None,
+        help="Directory for compiled templates, shared between runs",
+    )
     return parser
 
 
@@ -61,14 +61,24 @@ def save_to_json(d, filename: str):
         json.dump(d, f)
 
 
+# the extensions of the cohort file formats that can be read, see `cohort_utils`
+INPUT_FILE_EXTENSIONS = r"(feather|arrow|parquet)"
+
+
 def match_input_files(file: str, weekly=False) -> bool:
     """Checks if file name has format outputted by cohort extractor"""
     if weekly:
         pattern = (
-            r"^input_weekly_20\d\d-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])\.feather"
+            r"^input_weekly_20\d\d-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])\."
+            + INPUT_FILE_EXTENSIONS
+            + "$"
         )
     else:
-        pattern = r"^input_20\d\d-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])\.feather"
+        pattern = (
+            r"^input_20\d\d-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])\."
+            + INPUT_FILE_EXTENSIONS
+            + "$"
+        )
     return True if re.match(pattern, file) else False
 
 
@@ -80,55 +90,38 @@ def get_date_input_file(file: str, weekly=False) -> str:
 
     else:
         if weekly:
-            date = re.search(r"input_weekly_(.*).feather", file)
+            date = re.search(r"input_weekly_(.*)\.", file)
         else:
-            date = re.search(r"input_(.*).feather", file)
+            date = re.search(r"input_(.*)\.", file)
         return date.group(1)
 
 
-def plot_measures(
-    df,
+def plot_lines(
+    lines,
     filename: str,
-    column_to_plot: str,
     y_label: str,
-    category: str = None,
-    category_order: list = None,
+    y_max: float = None,
+    legend: list = None,
+    image_format: str = "png",
 ):
-    """Produce time series plot from measures table. If category is provided, one line is plotted for each sub
-    category within the category column. Saves output in 'output' dir as png file.
+    """Produce time series plot of one or more lines. Saves output as png (or `image_format`) file.
     Args:
-        df: A measure table
-        column_to_plot: Column name for y-axis values
+        lines: A list of (dates, values) pairs, one for each line
+        filename: Path to save the plot to, without the extension
         y_label: Label to use for y-axis
-        category: Name of column indicating different categories, optional
-        category_order: List of categories in order to plot, optional
+        y_max: The top of the y-axis, optional. Defaults to 1000, for plots with no values
+        legend: Labels of the lines, optional
+        image_format: File format to save the plot in, e.g. "png" or "svg"
     """
-    if category:
-        df[category] = df[category].fillna("Missing")
-
     _, ax = plt.subplots(figsize=(15, 8))
 
-    if category:
-        if category_order:
-            for unique_category in category_order:
-                df_subset = df[df[category] == unique_category].sort_values("date")
-                ax.plot(df_subset["date"], df_subset[column_to_plot])
-        else:
-            for unique_category in df[category].unique():
-                df_subset = df[df[category] == unique_category].sort_values("date")
-                ax.plot(df_subset["date"], df_subset[column_to_plot])
-    else:
-        ax.plot(df["date"], df[column_to_plot])
+    for dates, values in lines:
+        ax.plot(dates, values)
 
     ax.set(
         ylabel=y_label,
         xlabel="Date",
-        ylim=(
-            0,
-            1000
-            if df[column_to_plot].isnull().values.all()
-            else df[column_to_plot].max(),
-        ),
+        ylim=(0, 1000 if y_max is None else y_max),
     )
 
     month_locator = mdates.MonthLocator()
@@ -136,21 +129,13 @@ def plot_measures(
     ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
     plt.xticks(rotation="vertical")
 
-    if category:
-        if category_order:
-            ax.legend(
-                category_order,
-                bbox_to_anchor=(1.04, 1),
-                loc="upper left",
-                fontsize=20,
-            )
-        else:
-            ax.legend(
-                sorted(df[category].unique()),
-                bbox_to_anchor=(1.04, 1),
-                loc="upper left",
-                fontsize=20,
-            )
+    if legend is not None:
+        ax.legend(
+            legend,
+            bbox_to_anchor=(1.04, 1),
+            loc="upper left",
+            fontsize=20,
+        )
 
     ax.margins(x=0)
     ax.yaxis.label.set_size(25)
@@ -158,10 +143,92 @@ def plot_measures(
     ax.tick_params(axis="both", which="major", labelsize=20)
     plt.tight_layout()
     plt.style.use("seaborn")
-    plt.savefig(f"{filename}.png")
+    plt.savefig(f"{filename}.{image_format}")
     plt.close()
 
 
+def plot_measures(
+    df,
+    filename: str,
+    column_to_plot: str,
+    y_label: str,
+    category: str = None,
+    category_order: list = None,
+    image_format: str = "png",
+):
+    """Produce time series plot from measures table. If category is provided, one line is plotted for each sub
+    category within the category column. Saves output in 'output' dir as png (or `image_format`) file.
+    Args:
+        df: A measure table
+        column_to_plot: Column name for y-axis values
+        y_label: Label to use for y-axis
+        category: Name of column indicating different categories, optional
+        category_order: List of categories in order to plot, optional
+        image_format: File format to save the plot in, e.g. "png" or "svg"
+    """
+    legend = None
+    if category:
+        df[category] = df[category].fillna("Missing")
+
+        lines = []
+        for unique_category in category_order or df[category].unique():
+            df_subset = df[df[category] == unique_category].sort_values("date")
+            lines.append((df_subset["date"], df_subset[column_to_plot]))
+        legend = category_order or sorted(df[category].unique())
+    else:
+        lines = [(df["date"], df[column_to_plot])]
+
+    plot_lines(
+        lines,
+        filename,
+        y_label,
+        y_max=(
+            None
+            if df[column_to_plot].isnull().values.all()
+            else df[column_to_plot].max()
+        ),
+        legend=legend,
+        image_format=image_format,
+    )
+
+
+def period_column(variable, index_date):
+    """
+    The name of a variable extracted as of an index date, in cohorts extracted with
+    `study_definition_long`, e.g. "practice_2021_01_01".
+    """
+    return f"{variable}_{pd.Timestamp(index_date):%Y_%m_%d}"
+
+
+def registration_column(index_date):
+    """
+    The name of the flag of whether patients are registered on an index date, in
+    cohorts extracted with `study_definition_long`, e.g. "registered_2021_01_01".
+    """
+    return period_column("registered", index_date)
+
+
+def time_to_days(time_value, time_scale):
+    """
+    Converts the time period before an event to days.
+    Args:
+        time_value: Number of `time_scale` units, or None
+        time_scale: One of "weeks", "months" or "years", or None
+    """
+    if time_scale is None:
+        days = 0
+    elif time_scale == "weeks":
+        days = time_value * 7
+    elif time_scale == "months":
+        days = time_value * 28
+    elif time_scale == "years":
+        days = time_value * 365
+    else:
+        raise Exception(f"Unsupported time scale: {time_scale}")
+
+    return days
+
+
 def calculate_variable_windows_codelist_1(
     codelist_1_frequency,
 ):
@@ -210,6 +277,64 @@ def calculate_variable_windows_codelist_2(
     return codelist_2_date_range
 
 
+def get_quantiles(has_outer_percentiles=True):
+    """The quantiles of the deciles chart, optionally with the outer percentiles."""
+    quantiles = np.arange(0.1, 1, 0.1)
+    if has_outer_percentiles:
+        quantiles = np.concatenate(
+            [quantiles, np.arange(0.01, 0.1, 0.01), np.arange(0.91, 1, 0.01)]
+        )
+    return quantiles
+
+
+def practice_percentiles(rates, percentiles):
+    """
+    Computes percentiles of the practice rates for each period.
+
+    Args:
+        rates: a (practice × period) matrix of rates, with NaN where a practice has no rate
+        percentiles: the percentiles to compute, between 0 and 100
+
+    Returns:
+    A (percentile × period) matrix, with NaN for periods where no practice has a rate.
+    """
+    rates = np.where(np.isfinite(rates), rates, np.nan)
+    values = np.full((len(percentiles), rates.shape[1]), np.nan)
+    has_rates = ~np.isnan(rates).all(axis=0)
+    if has_rates.any():
+        values[:, has_rates] = np.nanpercentile(
+            rates[:, has_rates], percentiles, axis=0
+        )
+    return values
+
+
+def compute_matrix_deciles(store, period_column, has_outer_percentiles=True):
+    """
+    Computes deciles and other percentiles of the practice rates in a measure store.
+
+    Args:
+        store: the `MeasureStore`
+        period_column: the name to give the period column
+        has_outer_percentiles: whether to compute the nine largest and nine smallest percentiles
+
+    Returns:
+    A dataframe with the columns `compute_deciles` returns, for the periods with rates.
+    """
+    percentiles = np.round(get_quantiles(has_outer_percentiles) * 100)
+    values = store.practice_percentiles(percentiles)
+    has_rates = ~np.isnan(values).all(axis=0)
+
+    return pd.DataFrame(
+        {
+            period_column: np.tile(
+                np.asarray(store.periods)[has_rates], len(percentiles)
+            ),
+            "value": values[:, has_rates].ravel(),
+            "percentile": np.repeat(percentiles, has_rates.sum()),
+        }
+    )
+
+
 def compute_deciles(measure_table, groupby_col, value_col, has_outer_percentiles=True):
     """
     Computes deciles and other percentiles from a measure table.
@@ -223,11 +348,7 @@ def compute_deciles(measure_table, groupby_col, value_col, has_outer_percentiles
     Returns:
     A dataframe with columns for the grouping column, the value column, and the percentile.
     """
-    quantiles = np.arange(0.1, 1, 0.1)
-    if has_outer_percentiles:
-        quantiles = np.concatenate(
-            [quantiles, np.arange(0.01, 0.1, 0.01), np.arange(0.91, 1, 0.01)]
-        )
+    quantiles = get_quantiles(has_outer_percentiles)
 
     percentiles = (
         measure_table.groupby(groupby_col)[value_col]
@@ -253,6 +374,20 @@ def deciles_chart(df, filename, period_column=None, column=None, title="", ylabe
         ylabel: the label of the y-axis of the chart
     """
 
+    df = compute_deciles(
+        measure_table=df,
+        groupby_col=period_column,
+        value_col=column,
+        has_outer_percentiles=True,
+    )
+    plot_deciles(df, filename, period_column, column, title, ylabel)
+
+
+def plot_deciles(df, filename, period_column, column, title="", ylabel=""):
+    """
+    Plot the percentiles from `compute_deciles` as a deciles chart and save it to a
+    file. See `deciles_chart` for the arguments.
+    """
     sns.set_style("darkgrid")
 
     fig, ax = plt.subplots(figsize=(15, 8))
@@ -267,13 +402,6 @@ def deciles_chart(df, filename, period_column=None, column=None, title="", ylabe
         },
     }
 
-    df = compute_deciles(
-        measure_table=df,
-        groupby_col=period_column,
-        value_col=column,
-        has_outer_percentiles=True,
-    )
-
     label_seen = []
     for percentile in range(1, 100):
         data = df[df["percentile"] == percentile]
@@ -5,12 +5,15 @@ from cohortextractor import (
     params,
     patients,
 )
+from banding import RAW_VARIABLES
 from demographics import get_demographics
 from event_variables import generate_event_variables
+from expectations import AGE_YEARS, PRACTICE
 from populations import population_filters
 from report_utils import (
     calculate_variable_windows_codelist_1,
     calculate_variable_windows_codelist_2,
+    time_to_days,
 )
 
 
@@ -32,20 +35,12 @@ codelist_2_comparison_date = params["codelist_2_comparison_date"]
 codelist_1_frequency = params["codelist_1_frequency"]
 population_definition = params["population"]
 breakdowns = params["breakdowns"]
+derive_flags = params.get("derive_flags", "False").lower() == "true"
 
 # handle dates
 # TODO: handle events in the same period (week, day, month). Requires form changes
 
-if time_scale is None:
-    days = 0
-elif time_scale == "weeks":
-    days = time_value * 7
-elif time_scale == "months":
-    days = time_value * 28
-elif time_scale == "years":
-    days = time_value * 365
-else:
-    raise Exception(f"Unsupported time scale: {time_scale}")
+days = time_to_days(time_value, time_scale)
 
 if time_event == "before":
     codelist_2_period_start = f"- {days} days"
@@ -71,12 +66,12 @@ codelist_2_date_range = calculate_variable_windows_codelist_2(
 
 selected_population = population_filters[population_definition]
 
-if population_definition == "children":
-    demographics = get_demographics(children=True)
-else:
-    demographics = get_demographics()
+demographics = get_demographics()
 
-selected_demographics = {k: v for k, v in demographics.items() if k in breakdowns}
+breakdown_variables = {RAW_VARIABLES.get(b, b) for b in breakdowns.split(",")}
+selected_demographics = {
+    k: v for k, v in demographics.items() if k in breakdown_variables
+}
 
 study = StudyDefinition(
     index_date="2019-01-01",
@@ -88,19 +83,13 @@ study = StudyDefinition(
     population=selected_population,
     age_years=patients.age_as_of(
         "index_date",
-        return_expectations={
-            "rate": "universal",
-            "int": {"distribution": "population_ages"},
-        },
+        return_expectations=AGE_YEARS,
     ),
     **selected_demographics,
     practice=patients.registered_practice_as_of(
         "index_date",
         returning="pseudo_id",
-        return_expectations={
-            "int": {"distribution": "normal", "mean": 25, "stddev": 5},
-            "incidence": 0.5,
-        },
+        return_expectations=PRACTICE,
     ),
     **generate_event_variables(
         codelist_1_type,
@@ -110,6 +99,7 @@ study = StudyDefinition(
         codelist_2,
         codelist_2_date_range,
         ever=time_ever,
+        derive_flags=derive_flags,
     ),
 )
 
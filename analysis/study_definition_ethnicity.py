@@ -1,4 +1,5 @@
 from cohortextractor import StudyDefinition, codelist_from_csv, params, patients
+from expectations import ETHNICITY
 
 
 ethnicity_codes = codelist_from_csv(
@@ -28,18 +29,7 @@ study = StudyDefinition(
             "Black": "eth='4' OR (NOT eth AND ethnicity_sus='4')",
             "Other": "eth='5' OR (NOT eth AND ethnicity_sus='5')",
         },
-        return_expectations={
-            "category": {
-                "ratios": {
-                    "White": 0.2,
-                    "Mixed": 0.2,
-                    "South Asian": 0.2,
-                    "Black": 0.2,
-                    "Other": 0.2,
-                }
-            },
-            "incidence": 0.4,
-        },
+        return_expectations=ETHNICITY,
         ethnicity_sus=patients.with_ethnicity_from_sus(
             returning="group_6",
             use_most_frequent_code=True,
@@ -0,0 +1,196 @@
+import pandas as pd
+from cohortextractor import StudyDefinition, codelist_from_csv, params, patients
+from event_variables import period_events
+from expectations import IMD_RANK, PRACTICE, REGION, SEX
+from report_utils import (
+    generate_expectations_codes,
+    period_column,
+    registration_column,
+    time_to_days,
+)
+
+
+# Extracts each patient's events, and the variables that change over time, for every
+# period at once, rather than in one extraction per index date. `analysis.binning`
+# assigns them to monthly or weekly periods after extraction.
+#
+# Only the latest event in each period's window is extracted, as that's all that
+# `study_definition` extracts for a period. The windows are those of
+# `study_definition`, so `analysis.binning` must be run with the same frequency,
+# codelist 2 comparison date and time parameters as the cohort was extracted with.
+#
+# Registration, region, IMD and practice are extracted as of each index date, as
+# `study_definition` extracts them. Sex and date of birth don't change, and are
+# extracted once.
+
+codelist_1_path = params["codelist_1_path"]
+codelist_1_type = params["codelist_1_type"]
+codelist_2_path = params["codelist_2_path"]
+codelist_2_type = params["codelist_2_type"]
+time_value = (
+    None
+    if params["time_value"].lower().strip() in ("none", "")
+    else int(params["time_value"])
+)
+time_scale = (
+    None if params["time_scale"].lower() in ("none", "") else params["time_scale"]
+)
+time_ever = params.get("time_ever", "False").lower() == "true"
+codelist_2_comparison_date = params.get("codelist_2_comparison_date", "end_date")
+start_date = params["start_date"]
+end_date = params["end_date"]
+codelist_1_frequency = params.get("codelist_1_frequency", "monthly")
+
+days = time_to_days(time_value, time_scale)
+
+codelist_1 = codelist_from_csv(codelist_1_path, system="snomed", column="code")
+
+codelist_2 = codelist_from_csv(
+    codelist_2_path,
+    system="snomed",
+    column="code",
+)
+
+# The index dates are those of `analysis.binning.period_starts`, and the windows
+# those of `analysis.binning.codelist_1_windows` and `codelist_2_windows`
+index_dates = pd.date_range(
+    start_date, end_date, freq="7D" if codelist_1_frequency == "weekly" else "MS"
+)
+if codelist_1_frequency == "weekly":
+    window_ends = index_dates + pd.Timedelta(days=7)
+else:
+    window_ends = index_dates + pd.offsets.MonthEnd(0)
+codelist_1_windows = [
+    (f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}")
+    for start, end in zip(index_dates, window_ends)
+]
+
+lookback = pd.Timedelta(days=days)
+if codelist_2_comparison_date == "start_date":
+    codelist_2_windows = [
+        (f"{index_date - lookback:%Y-%m-%d}", f"{index_date:%Y-%m-%d}")
+        for index_date in index_dates
+    ]
+elif codelist_2_comparison_date == "end_date":
+    codelist_2_windows = [
+        (f"{start - lookback:%Y-%m-%d}", f"{end:%Y-%m-%d}")
+        for start, end in zip(index_dates, window_ends)
+    ]
+else:
+    # the days before each patient's codelist 1 event in the period
+    codelist_2_windows = [
+        (f"event_1_date_{i} - {days} days", f"event_1_date_{i}")
+        for i in range(1, len(index_dates) + 1)
+    ]
+if time_ever:
+    # any time on or before the end of the window
+    codelist_2_windows = [(None, end) for _, end in codelist_2_windows]
+
+if time_ever:
+    # With `time_ever`, whether a patient has codelist 2 in a period only depends
+    # on their earliest event, so it is extracted once rather than per index date.
+    if codelist_2_type == "event":
+        query = patients.with_these_clinical_events
+    else:
+        query = patients.with_these_medications
+    ever_variables = {
+        "event_2_ever_date": query(
+            codelist=codelist_2,
+            on_or_before=end_date,
+            returning="date",
+            date_format="YYYY-MM-DD",
+            find_first_match_in_period=True,
+            return_expectations={
+                "date": {"earliest": "1950-01-01", "latest": end_date},
+                "incidence": 0.5,
+            },
+        ),
+        "event_2_ever_code": query(
+            codelist=codelist_2,
+            on_or_before=end_date,
+            returning="code",
+            find_first_match_in_period=True,
+            return_expectations={
+                "category": {"ratios": generate_expectations_codes(codelist_2)},
+                "incidence": 0.5,
+            },
+        ),
+    }
+else:
+    ever_variables = {}
+
+# `analysis.binning` selects the population of each period by whether patients are
+# registered on its index date, as `study_definition`'s population does
+period_variables = {}
+for index_date in index_dates:
+    date = f"{index_date:%Y-%m-%d}"
+    period_variables.update(
+        {
+            registration_column(index_date): patients.registered_as_of(
+                date,
+                return_expectations={"incidence": 0.9},
+            ),
+            period_column("region", index_date): patients.registered_practice_as_of(
+                date,
+                returning="nuts1_region_name",
+                return_expectations=REGION,
+            ),
+            period_column("imd_rank", index_date): patients.address_as_of(
+                date,
+                returning="index_of_multiple_deprivation",
+                round_to_nearest=100,
+                return_expectations=IMD_RANK,
+            ),
+            period_column("practice", index_date): patients.registered_practice_as_of(
+                date,
+                returning="pseudo_id",
+                return_expectations=PRACTICE,
+            ),
+        }
+    )
+
+study = StudyDefinition(
+    index_date=end_date,
+    default_expectations={
+        "date": {"earliest": start_date, "latest": end_date},
+        "rate": "uniform",
+        "incidence": 0.5,
+    },
+    population=patients.satisfying(
+        """
+        (registered_at_start OR registered_at_end) AND
+        NOT died_before_start
+        """,
+        registered_at_start=patients.registered_as_of(
+            start_date,
+            return_expectations={"incidence": 0.9},
+        ),
+        registered_at_end=patients.registered_as_of(
+            end_date,
+            return_expectations={"incidence": 0.9},
+        ),
+        died_before_start=patients.died_from_any_cause(
+            on_or_before=start_date,
+            returning="binary_flag",
+            return_expectations={"incidence": 0.05},
+        ),
+    ),
+    date_of_birth=patients.date_of_birth(
+        date_format="YYYY-MM",
+        return_expectations={
+            "rate": "universal",
+            "date": {"earliest": "1920-01-01", "latest": end_date},
+        },
+    ),
+    died_date=patients.died_from_any_cause(
+        on_or_before=end_date,
+        returning="date_of_death",
+        date_format="YYYY-MM-DD",
+        return_expectations={"incidence": 0.05},
+    ),
+    sex=patients.sex(return_expectations=SEX),
+    **period_variables,
+    **period_events(codelist_1_type, codelist_1, codelist_1_windows, "event_1"),
+    **period_events(codelist_2_type, codelist_2, codelist_2_windows, "event_2"),
+    **ever_variables,
+)
@@ -0,0 +1,125 @@
+"""
+Checks the vectorised disclosure control against the implementations it replaced,
+on random counts. The previous implementations are kept here as oracles.
+
+Run with `python -m pytest analysis/test_disclosure.py`.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.disclosure import round_count, round_to_base
+from analysis.measures import redact_and_round_column
+from analysis.top_5 import group_low_values
+
+SEEDS = range(20)
+
+
+def old_redact_and_round_column(df, col, decimals=-1):
+    """Redact values less-than or equal-to 10 and then round values to nearest 10."""
+    df[col] = df[col].apply(lambda x: x if x > 10 else 0)
+    df[col] = df[col].apply(round, ndigits=decimals)
+    return df
+
+
+def old_round_values(x, base=5):
+    rounded = x
+    if isinstance(x, (int, float)):
+        if np.isnan(x):
+            rounded = np.nan
+        else:
+            rounded = int(base * round(x / base))
+    return rounded
+
+
+def old_round_to_nearest(x, *, base):
+    return base * round(x / base)
+
+
+def old_group_low_values(df, count_column, code_column, threshold):
+    suppressed_count = df.loc[df[count_column] <= threshold, count_column].sum()
+    suppressed_df = df.loc[df[count_column] > threshold, count_column]
+
+    if (suppressed_count > 0) | (
+        (suppressed_count == 0) & (len(suppressed_df) != len(df))
+    ):
+        df.loc[df[count_column] <= threshold, count_column] = np.nan
+
+        if suppressed_count == 0:
+            df.loc[df[count_column] == 0, :] = np.nan
+
+        else:
+            while suppressed_count <= threshold:
+                suppressed_count += df[count_column].min()
+                df.loc[df[count_column].idxmin(), :] = np.nan
+
+        df = df.loc[df[count_column].notnull(), :]
+
+        if suppressed_count > threshold:
+            suppressed_count = {code_column: "Other", count_column: suppressed_count}
+            df = pd.concat([df, pd.DataFrame([suppressed_count])], ignore_index=True)
+
+    return df
+
+
+def random_counts(rng, size, high=1_000):
+    # mostly small counts, so that values around the thresholds and the half way
+    # points are common
+    return np.where(
+        rng.random(size) < 0.5,
+        rng.integers(0, 30, size),
+        rng.integers(0, high, size),
+    )
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("base", [5, 7, 10, 100])
+def test_round_to_base_matches_round_builtin(seed, base):
+    rng = np.random.default_rng(seed)
+    counts = random_counts(rng, 1_000, high=10**12)
+
+    expected = [old_round_to_nearest(int(x), base=base) for x in counts]
+    assert round_to_base(counts, base).astype(np.int64).tolist() == expected
+    assert [round_count(int(x), base) for x in counts] == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("base", [5, 10])
+def test_round_to_base_matches_round_values(seed, base):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate(
+        [random_counts(rng, 500), rng.uniform(0, 1_000, 500), [np.nan] * 10]
+    )
+
+    expected = [old_round_values(float(x), base) for x in values]
+    np.testing.assert_array_equal(round_to_base(values, base), expected)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("floats", [False, True])
+def test_redact_and_round_column(seed, floats):
+    rng = np.random.default_rng(seed)
+    values = random_counts(rng, 1_000)
+    if floats:
+        values = values + rng.choice([0, 0.25, 0.5], len(values))
+    df = pd.DataFrame({"numerator": values})
+
+    expected = old_redact_and_round_column(df.copy(), "numerator")
+    pd.testing.assert_frame_equal(
+        redact_and_round_column(df.copy(), "numerator"), expected
+    )
+
+
+@pytest.mark.parametrize("seed", range(2_000))
+def test_group_low_values(seed):
+    rng = np.random.default_rng(seed)
+    size = rng.integers(1, 12)
+    counts = rng.integers(0, rng.choice([10, 30, 200]), size)
+    threshold = int(rng.choice([5, 7, 10]))
+    df = pd.DataFrame({"code": [f"code_{i}" for i in range(size)], "num": counts})
+
+    expected = old_group_low_values(df.copy(), "num", "code", threshold)
+    pd.testing.assert_frame_equal(
+        group_low_values(df.copy(), "num", "code", threshold).reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
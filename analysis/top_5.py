@@ -1,7 +1,7 @@
 import argparse
 
-import numpy as np
 import pandas as pd
+from analysis.disclosure import round_to_base, suppress_low_values
 
 
 def write_csv(df, path, **kwargs):
@@ -22,32 +22,13 @@ def group_low_values(df, count_column, code_column, threshold):
         A table with redacted counts
     """
 
-    # get sum of any values <= threshold
-    suppressed_count = df.loc[df[count_column] <= threshold, count_column].sum()
-    suppressed_df = df.loc[df[count_column] > threshold, count_column]
+    suppressed, suppressed_count = suppress_low_values(df[count_column], threshold)
 
-    # if suppressed values >0 ensure total suppressed count > threshold.
-    # Also suppress if all values 0
-    if (suppressed_count > 0) | (
-        (suppressed_count == 0) & (len(suppressed_df) != len(df))
-    ):
-        # redact counts <= threshold
-        df.loc[df[count_column] <= threshold, count_column] = np.nan
+    # if any values are suppressed, drop them and add their total as an "Other" row,
+    # as long as it's more than the threshold
+    if suppressed.any():
+        df = df.loc[~suppressed, :]
 
-        # If all values 0, suppress them
-        if suppressed_count == 0:
-            df.loc[df[count_column] == 0, :] = np.nan
-
-        else:
-            # if suppressed count <= threshold redact further values
-            while suppressed_count <= threshold:
-                suppressed_count += df[count_column].min()
-                df.loc[df[count_column].idxmin(), :] = np.nan
-
-        # drop all rows where count column is null
-        df = df.loc[df[count_column].notnull(), :]
-
-        # add suppressed count as "Other" row (if > threshold)
         if suppressed_count > threshold:
             suppressed_count = {code_column: "Other", count_column: suppressed_count}
             df = pd.concat([df, pd.DataFrame([suppressed_count])], ignore_index=True)
@@ -55,16 +36,6 @@ def group_low_values(df, count_column, code_column, threshold):
     return df
 
 
-def round_values(x, base=5):
-    rounded = x
-    if isinstance(x, (int, float)):
-        if np.isnan(x):
-            rounded = np.nan
-        else:
-            rounded = int(base * round(x / base))
-    return rounded
-
-
 def create_top_5_code_table(
     df, code_df, code_column, term_column, low_count_threshold, rounding_base, nrows=5
 ):
@@ -86,9 +57,7 @@ def create_top_5_code_table(
 
     # round
 
-    event_counts["num"] = event_counts["num"].apply(
-        lambda x: round_values(x, rounding_base)
-    )
+    event_counts["num"] = round_to_base(event_counts["num"], rounding_base).astype(int)
 
     # calculate % makeup of each code
     total_events = event_counts["num"].sum()
@@ -142,21 +111,26 @@ def parse_args():
     return args
 
 
-def main():
-    args = parse_args()
-    codelist_1_path = args.codelist_1_path
-    codelist_2_path = args.codelist_2_path
-    measure_df = pd.read_csv(f"{args.output_dir}/joined/measure_all.csv")
+def get_top_5_tables(measure_df, group, codelist_path):
+    """
+    Create the top 5 code tables for a codelist from the measure table.
 
-    code_df = measure_df.loc[measure_df["group"] == "event_1_code", :]
-    codelist = pd.read_csv(f"{codelist_1_path}", dtype={"code": str})
+    Args:
+        measure_df: A measure table, as written to measure_all.csv.
+        group: The group of the codelist's codes, "event_1_code" or "event_2_code".
+        codelist_path: Path to the codelist.
+    Returns:
+        The top 5 code table, and the table with the counts of every code.
+    """
+    code_df = measure_df.loc[measure_df["group"] == group, :]
+    codelist = pd.read_csv(f"{codelist_path}", dtype={"code": str})
 
     events_per_code = (
         code_df.groupby("group_value")[["event_measure"]].sum().reset_index()
     )
     events_per_code.columns = ["code", "num"]
 
-    top_5_code_table, top_5_code_table_with_counts = create_top_5_code_table(
+    return create_top_5_code_table(
         df=events_per_code,
         code_df=codelist,
         code_column="code",
@@ -164,36 +138,42 @@ def main():
         low_count_threshold=7,
         rounding_base=7,
     )
-    top_5_code_table.to_csv(
-        f"{args.output_dir}/joined/top_5_code_table_1.csv", index=False
-    )
-    top_5_code_table_with_counts.to_csv(
-        f"{args.output_dir}/joined/top_5_code_table_with_counts_1.csv", index=False
-    )
 
-    code_df_2 = measure_df.loc[measure_df["group"] == "event_2_code", :]
 
+def write_top_5_tables(measure_df, codelist_1_path, codelist_2_path, output_dir):
+    """
+    Create and write the top 5 code tables for both codelists.
+
+    Args:
+        measure_df: A measure table, as written to measure_all.csv.
+        codelist_1_path: Path to codelist 1.
+        codelist_2_path: Path to codelist 2.
+        output_dir: The output directory. The tables are written to its "joined"
+            directory.
+    Returns:
+        The top 5 code tables for codelist 1 and codelist 2.
+    """
     # TODO: support vpids?
-    codelist_2 = pd.read_csv(f"{codelist_2_path}", dtype={"code": str})
-    events_per_code = (
-        code_df_2.groupby("group_value")[["event_measure"]].sum().reset_index()
-    )
-    events_per_code.columns = ["code", "num"]
+    top_5_code_tables = []
+    for i, codelist_path in enumerate([codelist_1_path, codelist_2_path], start=1):
+        top_5_code_table, top_5_code_table_with_counts = get_top_5_tables(
+            measure_df, f"event_{i}_code", codelist_path
+        )
+        top_5_code_table.to_csv(
+            f"{output_dir}/joined/top_5_code_table_{i}.csv", index=False
+        )
+        top_5_code_table_with_counts.to_csv(
+            f"{output_dir}/joined/top_5_code_table_with_counts_{i}.csv", index=False
+        )
+        top_5_code_tables.append(top_5_code_table)
+    return top_5_code_tables
 
-    top_5_code_table, top_5_code_table_with_counts = create_top_5_code_table(
-        df=events_per_code,
-        code_df=codelist_2,
-        code_column="code",
-        term_column="term",
-        low_count_threshold=7,
-        rounding_base=7,
-    )
 
-    top_5_code_table.to_csv(
-        f"{args.output_dir}/joined/top_5_code_table_2.csv", index=False
-    )
-    top_5_code_table_with_counts.to_csv(
-        f"{args.output_dir}/joined/top_5_code_table_with_counts_2.csv", index=False
+def main():
+    args = parse_args()
+    measure_df = pd.read_csv(f"{args.output_dir}/joined/measure_all.csv")
+    write_top_5_tables(
+        measure_df, args.codelist_1_path, args.codelist_2_path, args.output_dir
     )
 
 